@@ -0,0 +1,89 @@
+import argparse
+import asyncio
+from datetime import datetime, timedelta, timezone
+import random
+import time
+
+from receipt_statement_linker.config import Config
+from receipt_statement_linker.extract import merge_statements_receipts
+from receipt_statement_linker.receipt import (
+    ReceiptEntry,
+    TranscribedReceipt,
+    TranscribedReceipts,
+)
+from receipt_statement_linker.statement import (
+    Transaction,
+    TranscribedStatement,
+    TranscribedStatements,
+)
+
+
+def synthetic_inputs(
+    n_transactions: int, receipt_ratio: float, seed: int
+) -> tuple[TranscribedStatements, TranscribedReceipts]:
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    transactions: list[Transaction] = []
+    receipts: list[TranscribedReceipt] = []
+    for i in range(n_transactions):
+        # NOTE: amounts are unique per transaction so the benchmark never reaches the matching model
+        amount = (i + 1) / 100
+        when = start + timedelta(minutes=rng.randrange(365 * 24 * 60))
+        transactions.append(
+            Transaction(
+                name=f"VENDOR {i}",
+                datetime=when,
+                withdrawl_amount=amount,
+                deposit_amount=None,
+            )
+        )
+        if rng.random() < receipt_ratio:
+            receipts.append(
+                TranscribedReceipt(
+                    vendor=f"Vendor {i}",
+                    datetime=when - timedelta(days=rng.randrange(3)),
+                    subtotal=amount,
+                    grand_total=amount,
+                    items=[ReceiptEntry(quantity=1, name="item", price=amount)],
+                )
+            )
+    rng.shuffle(receipts)
+
+    statements = TranscribedStatements(
+        transcribed_statements=[
+            TranscribedStatement(
+                opening_balance=None, transactions=transactions, closing_balance=None
+            )
+        ]
+    )
+    return statements, TranscribedReceipts(transcribed_receipts=receipts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark merge_statements_receipts")
+    parser.add_argument("--transactions", type=int, default=100_000)
+    parser.add_argument("--receipt-ratio", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--strategy", choices=["greedy", "scored"], default="greedy")
+    args = parser.parse_args()
+    Config.get_config().matching_strategy = args.strategy
+
+    statements, receipts = synthetic_inputs(
+        args.transactions, args.receipt_ratio, args.seed
+    )
+
+    start = time.perf_counter()
+    pairs = asyncio.run(merge_statements_receipts(statements, receipts))
+    elapsed = time.perf_counter() - start
+
+    matched = sum(pair.receipt is not None for pair in pairs)
+    print(
+        f"strategy={args.strategy} transactions={args.transactions} receipts={len(receipts.transcribed_receipts)} "
+        f"matched={matched} elapsed={elapsed:.3f}s "
+        f"throughput={args.transactions / elapsed:,.0f} transactions/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
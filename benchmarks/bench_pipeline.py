@@ -0,0 +1,265 @@
+import argparse
+from datetime import datetime, timedelta, timezone
+import json
+import os
+from pathlib import Path
+import random
+import sys
+import tempfile
+import time
+from typing import Any
+
+from fake_llm import FakeLLM
+
+from receipt_statement_linker import main as cli
+from receipt_statement_linker import metrics as metrics_module
+from receipt_statement_linker import ratelimit as ratelimit_module
+from receipt_statement_linker import vendor as vendor_module
+from receipt_statement_linker.output import load_pairs
+
+VENDOR_WORDS = "Maple Harbor Cedar Summit Golden River Union North Pioneer Willow Granite Lakeside Metro Sunrise Oak Atlas".split()
+VENDOR_KINDS = "Bakery Grocers Pharmacy Hardware Cafe Books Fuel Market Kitchen Outfitters Cinema Garage".split()
+
+
+def _vendor_names(n: int, rng: random.Random) -> list[str]:
+    names = [f"{word} {kind}" for word in VENDOR_WORDS for kind in VENDOR_KINDS]
+    rng.shuffle(names)
+    return names[:n]
+
+
+def _transaction_name(vendor: str, rng: random.Random, abbreviate: bool) -> str:
+    name = vendor.upper()
+    if abbreviate:
+        # NOTE: "MPL BKRY" style names land between the local thresholds and go to the matching model
+        name = " ".join(
+            word[0] + "".join(c for c in word[1:] if c not in "AEIOU")
+            for word in name.split()
+        )
+    return f"{name} #{rng.randrange(1000, 9999)}"
+
+
+def write_dataset(
+    root: Path,
+    n_transactions: int,
+    receipt_ratio: float,
+    collision_rate: float,
+    abbreviate_rate: float,
+    transactions_per_statement: int,
+    seed: int,
+) -> dict[str, str]:
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    vendors = _vendor_names(max(1, min(n_transactions // 20, 192)), rng)
+    receipts_dir, statements_dir = root / "receipts", root / "statements"
+    receipts_dir.mkdir()
+    statements_dir.mkdir()
+
+    vendor_by_name: dict[str, str] = {}
+    transactions: list[dict[str, Any]] = []
+    amounts: list[float] = []
+    for i in range(n_transactions):
+        vendor = rng.choice(vendors)
+        if amounts and rng.random() < collision_rate:
+            amount = rng.choice(amounts)
+        else:
+            amount = round(rng.uniform(1, 500), 2)
+        amounts.append(amount)
+        when = start + timedelta(minutes=rng.randrange(365 * 24 * 60))
+        name = _transaction_name(vendor, rng, rng.random() < abbreviate_rate)
+        vendor_by_name[name] = vendor
+        transactions.append(
+            {
+                "name": name,
+                "datetime": when.isoformat(),
+                "withdrawl_amount": amount,
+                "deposit_amount": None,
+            }
+        )
+
+        if rng.random() < receipt_ratio:
+            item_count = rng.randint(1, 3)
+            item_prices = [round(amount / item_count, 2)] * (item_count - 1)
+            item_prices.append(round(amount - sum(item_prices), 2))
+            receipt = {
+                "vendor": vendor,
+                "datetime": (when - timedelta(days=rng.randrange(3))).isoformat(),
+                "subtotal": amount,
+                "grand_total": amount,
+                "items": [
+                    {"quantity": 1, "name": f"{vendor} item {j}", "price": price}
+                    for j, price in enumerate(item_prices)
+                ],
+            }
+            # NOTE: .png so inputs pass the document filter without the images or pdf extras kicking in
+            (receipts_dir / f"receipt_{i:06d}.png").write_text(json.dumps(receipt))
+
+    balance = 1_000_000.0
+    for n, i in enumerate(range(0, n_transactions, transactions_per_statement)):
+        chunk = transactions[i : i + transactions_per_statement]
+        closing_balance = round(balance - sum(t["withdrawl_amount"] for t in chunk), 2)
+        statement = {
+            "opening_balance": balance,
+            "transactions": chunk,
+            "closing_balance": closing_balance,
+        }
+        (statements_dir / f"statement_{n:04d}.png").write_text(json.dumps(statement))
+        balance = closing_balance
+
+    return vendor_by_name
+
+
+def _reset_singletons():
+    metrics_module._METRICS = None
+    vendor_module._VENDOR_MATCHER = None
+    # NOTE: each run starts with an empty rate limit window
+    ratelimit_module._RATE_LIMITERS.clear()
+
+
+def run_once(args: argparse.Namespace, n_transactions: int) -> dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        for envar in (
+            "XDG_CONFIG_HOME",
+            "XDG_CACHE_HOME",
+            "XDG_DATA_HOME",
+            "XDG_STATE_HOME",
+        ):
+            os.environ[envar] = str(root / envar.lower())
+        if args.config:
+            config_dir = root / "xdg_config_home" / "receipt_statement_linker"
+            config_dir.mkdir(parents=True)
+            (config_dir / "config.toml").write_text(Path(args.config).read_text())
+
+        vendor_by_name = write_dataset(
+            root,
+            n_transactions,
+            args.receipt_ratio,
+            args.collision_rate,
+            args.abbreviate_rate,
+            args.transactions_per_statement,
+            args.seed,
+        )
+        FakeLLM(
+            vendor_by_name,
+            latency_ms=args.latency_ms,
+            jitter_ms=args.jitter_ms,
+            error_rate=args.error_rate,
+            requests_per_minute=args.rpm,
+            seed=args.seed,
+        ).install()
+        _reset_singletons()
+
+        output_path, metrics_path = root / "output.ndjson", root / "metrics.json"
+        sys.argv = [
+            "receipt-statement-linker",
+            *("--receipt-input", str(root / "receipts")),
+            *("--statement-input", str(root / "statements")),
+            *("--receipt-output", str(output_path)),
+            *("--output-format", "ndjson"),
+            *("--metrics-output", str(metrics_path)),
+        ]
+        if args.categorize:
+            sys.argv.append("--categorize")
+        if not args.with_cache:
+            sys.argv.append("--no-cache")
+
+        start = time.perf_counter()
+        cli.main()
+        elapsed = time.perf_counter() - start
+
+        pairs = load_pairs(str(output_path))
+        matched = [pair for pair in pairs if pair["receipt"] is not None]
+        correct = sum(
+            vendor_by_name[pair["transaction"]["name"]] == pair["receipt"]["vendor"]
+            for pair in matched
+        )
+        with open(metrics_path) as f:
+            run_metrics = json.load(f)
+
+    return {
+        "transactions": n_transactions,
+        "pairs": len(pairs),
+        "matched": len(matched),
+        "correct": correct,
+        "elapsed_seconds": elapsed,
+        "transactions_per_second": n_transactions / elapsed,
+        "metrics": run_metrics,
+    }
+
+
+def print_result(result: dict[str, Any]):
+    print(
+        f"transactions={result['transactions']} pairs={result['pairs']} "
+        f"matched={result['matched']} correct={result['correct']} "
+        f"elapsed={result['elapsed_seconds']:.3f}s "
+        f"throughput={result['transactions_per_second']:,.0f} transactions/s"
+    )
+    run_metrics = result["metrics"]
+    for stage, stage_metrics in run_metrics["stages"].items():
+        print(f"  {stage}: {stage_metrics['wall_seconds']:.3f}s")
+    for completion in run_metrics["completions"]:
+        print(
+            f"  {completion['stage']} requests={completion['requests']} "
+            f"failures={completion['failures']} "
+            f"p50={completion['wall_seconds_p50'] * 1000:.1f}ms "
+            f"p95={completion['wall_seconds_p95'] * 1000:.1f}ms "
+            f"max={completion['wall_seconds_max'] * 1000:.1f}ms"
+        )
+    for stage, queue_wait in run_metrics["queue_wait"].items():
+        print(
+            f"  {stage} queue_wait total={queue_wait['total_seconds']:.3f}s "
+            f"p95={queue_wait['p95_seconds'] * 1000:.1f}ms"
+        )
+    if run_metrics["counters"]:
+        print(f"  counters: {run_metrics['counters']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the CLI end to end against a deterministic fake LLM backend"
+    )
+    parser.add_argument(
+        "--transactions", type=int, nargs="+", default=[10, 1_000, 10_000]
+    )
+    parser.add_argument("--receipt-ratio", type=float, default=0.5)
+    parser.add_argument(
+        "--collision-rate",
+        type=float,
+        default=0.05,
+        help="Fraction of transactions that reuse an earlier transaction's amount",
+    )
+    parser.add_argument(
+        "--abbreviate-rate",
+        type=float,
+        default=0.2,
+        help="Fraction of transaction names abbreviated beyond what the local vendor matcher can decide",
+    )
+    parser.add_argument("--transactions-per-statement", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=25.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rpm", type=int, help="Fake provider requests per minute")
+    parser.add_argument("--categorize", action="store_true")
+    parser.add_argument(
+        "--with-cache",
+        action="store_true",
+        help="Use the (temporary) transcription cache and memos instead of --no-cache",
+    )
+    parser.add_argument("--config", help="config.toml to run the CLI with")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", help="Write all results as JSON to this path")
+    args = parser.parse_args()
+
+    results = []
+    for n_transactions in args.transactions:
+        result = run_once(args, n_transactions)
+        print_result(result)
+        results.append(result)
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ["litellm", "pydantic", "PIL", "pypdf", "opentelemetry"]
+
+CASES = {
+    "--help": ["--help"],
+    "usage error": ["--receipt-output", "out.json"],
+}
+
+
+def time_command(args: list[str], runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "receipt_statement_linker.main", *args],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def heavy_modules_loaded() -> list[str]:
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, receipt_statement_linker.main; print(' '.join(sys.modules))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    loaded = result.stdout.split()
+    return [
+        module
+        for module in HEAVY_MODULES
+        if any(name == module or name.startswith(f"{module}.") for name in loaded)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check CLI startup time and that heavy dependencies are imported lazily"
+    )
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument(
+        "--max-ms",
+        type=float,
+        default=200.0,
+        help="Fail if the median time of any case is above this",
+    )
+    args = parser.parse_args()
+
+    failed = False
+    for name, case_args in CASES.items():
+        elapsed_ms = time_command(case_args, args.runs) * 1000
+        over = elapsed_ms > args.max_ms
+        failed |= over
+        print(f"{name}: median={elapsed_ms:.0f}ms{' (over budget)' if over else ''}")
+
+    loaded = heavy_modules_loaded()
+    if loaded:
+        failed = True
+        print(f"imported by receipt_statement_linker.main: {', '.join(loaded)}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import asyncio
+import base64
+from collections import deque
+import json
+import random
+import re
+import time
+from typing import Any
+
+import litellm
+from litellm.types.utils import Choices, Message, ModelResponse, Usage
+from pydantic import BaseModel
+
+from receipt_statement_linker.categorize import Categories
+from receipt_statement_linker.match import VendorMatches
+from receipt_statement_linker.metrics import CompletionRecord, Metrics
+from receipt_statement_linker.ratelimit import estimate_tokens
+from receipt_statement_linker.receipt import TranscribedReceipts
+from receipt_statement_linker.statement import TranscribedStatements
+
+_INDEX_PATTERN = re.compile(r"<index>\n(\d+)\n</index>")
+_VENDOR_GROUP_PATTERN = re.compile(
+    r"<index>\n(\d+)\n</index>\n<statement_transaction_name>\n(.*?)\n</statement_transaction_name>\n<receipt_vendors>\n(.*?)\n</receipt_vendors>",
+    re.DOTALL,
+)
+
+
+def _file_payloads(messages: list[dict]) -> list[Any]:
+    # NOTE: synthetic input files hold their own ground truth JSON, so "transcribing" is decoding the data url
+    payloads: list[Any] = []
+    for message in messages:
+        if not isinstance(message["content"], list):
+            continue
+        for part in message["content"]:
+            url = part["image_url"]["url"]
+            payloads.append(json.loads(base64.b64decode(url.split(",", 1)[1])))
+    return payloads
+
+
+def _user_text(messages: list[dict]) -> str:
+    return next(
+        message["content"]
+        for message in messages
+        if message["role"] == "user" and isinstance(message["content"], str)
+    )
+
+
+class FakeLLM:
+    def __init__(
+        self,
+        vendor_by_name: dict[str, str],
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        requests_per_minute: int | None = None,
+        seed: int = 0,
+    ):
+        self.vendor_by_name = vendor_by_name
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.requests_per_minute = requests_per_minute
+        self._rng = random.Random(seed)
+        self._window: deque[float] = deque()
+
+    def install(self):
+        litellm.acompletion = self.acompletion
+
+    def _content(self, messages: list[dict], response_format: type[BaseModel]) -> str:
+        if response_format is TranscribedReceipts:
+            return json.dumps({"transcribed_receipts": _file_payloads(messages)})
+        if response_format is TranscribedStatements:
+            return json.dumps({"transcribed_statements": _file_payloads(messages)})
+        if response_format is VendorMatches:
+            return self._vendor_matches(_user_text(messages))
+        if issubclass(response_format, Categories):
+            return self._categories(_user_text(messages), response_format)
+        raise ValueError(f"FakeLLM has no response for {response_format.__name__}")
+
+    def _vendor_matches(self, user_text: str) -> str:
+        matches = []
+        for index, name, vendors in _VENDOR_GROUP_PATTERN.findall(user_text):
+            true_vendor = self.vendor_by_name.get(name)
+            matches.append(
+                {
+                    "index": int(index),
+                    "matching_candidates": [
+                        j
+                        for j, line in enumerate(vendors.splitlines(), start=1)
+                        if line.split(". ", 1)[1] == true_vendor
+                    ],
+                }
+            )
+        return json.dumps({"matches": matches})
+
+    def _categories(self, user_text: str, response_format: type[Categories]) -> str:
+        category_basemodel = response_format.model_fields[
+            "categories"
+        ].annotation.__args__[0]
+        categories = [
+            category.value
+            for category in category_basemodel.model_fields["category"].annotation
+        ]
+        rows = _INDEX_PATTERN.split(user_text)[1:]
+        return json.dumps(
+            {
+                "categories": [
+                    {
+                        "index": int(index),
+                        "category": categories[sum(row.encode()) % len(categories)],
+                    }
+                    for index, row in zip(rows[::2], rows[1::2])
+                ]
+            }
+        )
+
+    def _check_rate_limit(self, model: str):
+        if not self.requests_per_minute:
+            return
+        now = time.monotonic()
+        while self._window and self._window[0] <= now - 60:
+            self._window.popleft()
+        if len(self._window) >= self.requests_per_minute:
+            raise litellm.RateLimitError(
+                message="FakeLLM requests per minute exceeded",
+                llm_provider="fake",
+                model=model,
+            )
+        self._window.append(now)
+
+    async def acompletion(
+        self,
+        model: str,
+        messages: list[dict],
+        response_format: type[BaseModel],
+        **kwargs: Any,
+    ) -> ModelResponse:
+        start = time.perf_counter()
+        success = False
+        input_tokens = sum(
+            estimate_tokens(message["content"])
+            if isinstance(message["content"], str)
+            else 258 * len(message["content"])
+            for message in messages
+        )
+        output_tokens = 0
+        try:
+            self._check_rate_limit(model)
+            latency = max(
+                0.0, self.latency_ms + self._rng.uniform(-1, 1) * self.jitter_ms
+            )
+            await asyncio.sleep(latency / 1000)
+            if self._rng.random() < self.error_rate:
+                raise litellm.ServiceUnavailableError(
+                    message="FakeLLM injected error", llm_provider="fake", model=model
+                )
+
+            content = self._content(messages, response_format)
+            output_tokens = estimate_tokens(content)
+            success = True
+            return ModelResponse(
+                model=model,
+                choices=[
+                    Choices(
+                        index=0,
+                        finish_reason="stop",
+                        message=Message(content=content, role="assistant"),
+                    )
+                ],
+                usage=Usage(
+                    prompt_tokens=input_tokens,
+                    completion_tokens=output_tokens,
+                    total_tokens=input_tokens + output_tokens,
+                ),
+            )
+        finally:
+            # NOTE: litellm's callbacks never run for the stand-in, so record what the metrics callback would
+            wall_seconds = time.perf_counter() - start
+            Metrics.get_metrics().completions.append(
+                CompletionRecord(
+                    stage=Metrics.current_stage(),
+                    model=model,
+                    wall_seconds=wall_seconds,
+                    input_tokens=input_tokens,
+                    output_tokens=output_tokens,
+                    cost=0.0,
+                    success=success,
+                    retries=int(kwargs.get("metadata", {}).get("attempt", 0) > 0),
+                )
+            )
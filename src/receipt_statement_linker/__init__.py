@@ -0,0 +1,15 @@
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .linker import Linker as Linker
+
+__all__ = ["Linker"]
+
+
+# NOTE: resolved on first use so importing the package (e.g. for the CLI) doesn't load the whole pipeline
+def __getattr__(name: str):
+    if name == "Linker":
+        from .linker import Linker
+
+        return Linker
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
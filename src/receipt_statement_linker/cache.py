@@ -0,0 +1,133 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import time
+from typing import TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+from .config import Config, get_app_dir
+from .metrics import Metrics
+from .receipt import FileInput
+
+M = TypeVar("M", bound=BaseModel)
+
+
+# NOTE: LRU is tracked through file mtimes, hits bump the mtime and eviction drops the oldest first
+class TranscriptionCache:
+    def __init__(
+        self,
+        cache_dir: Path | None = None,
+        max_bytes: int | None = None,
+        refresh: bool = False,
+        refresh_since: float | None = None,
+    ):
+        self._dir = cache_dir or (
+            get_app_dir("XDG_CACHE_HOME", Path.home() / ".cache") / "transcriptions"
+        )
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self._max_bytes = (
+            max_bytes
+            if max_bytes is not None
+            else Config.get_config().transcription_cache_max_bytes
+        )
+        # NOTE: refresh skips entries from before the run but still writes, so a refreshed run repopulates
+        # the cache, and a resumed refreshed run (refresh_since = original start) keeps what it already redid
+        self._refreshed_after = (refresh_since or time.time()) if refresh else None
+        self._size: int | None = None
+
+    @staticmethod
+    def key(
+        files: list[FileInput],
+        model: str,
+        system_prompt: str,
+        response_format: type[BaseModel],
+    ) -> str:
+        digest = hashlib.sha256()
+        digest.update(model.encode())
+        digest.update(b"\0")
+        digest.update(system_prompt.encode())
+        digest.update(b"\0")
+        digest.update(
+            json.dumps(response_format.model_json_schema(), sort_keys=True).encode()
+        )
+        for file in files:
+            digest.update(b"\0")
+            digest.update(file.sha256.encode())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self._dir / f"{key}.json"
+
+    def get(self, key: str, response_format: type[M]) -> M | None:
+        path = self._path(key)
+        try:
+            stale = (
+                self._refreshed_after is not None
+                and path.stat().st_mtime < self._refreshed_after
+            )
+            data = None if stale else path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            data = None
+        if data is None:
+            Metrics.get_metrics().increment("transcription_cache_misses")
+            return None
+
+        try:
+            value = response_format.model_validate_json(data)
+        except ValidationError:
+            logging.warning("Dropping invalid transcription cache entry %s", path)
+            path.unlink(missing_ok=True)
+            return None
+
+        os.utime(path)
+        logging.debug("Transcription cache hit %s", key)
+        Metrics.get_metrics().increment("transcription_cache_hits")
+        return value
+
+    def set(self, key: str, value: BaseModel):
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(value.model_dump_json(), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+        if self._size is None:
+            self._size = sum(entry.stat().st_size for entry in self._dir.glob("*.json"))
+        else:
+            self._size += path.stat().st_size
+
+        if self._size > self._max_bytes:
+            self._evict()
+
+    def _evict(self):
+        entries = sorted(
+            ((entry.stat(), entry) for entry in self._dir.glob("*.json")),
+            key=lambda stat_entry: stat_entry[0].st_mtime,
+        )
+        size = sum(stat.st_size for stat, _ in entries)
+        for stat, entry in entries:
+            if size <= self._max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            size -= stat.st_size
+        self._size = size
+
+
+class DeferredTranscriptionCache(TranscriptionCache):
+    # NOTE: for re-extraction, never reads and only writes once commit() says the result was kept
+    def __init__(self, cache: TranscriptionCache):
+        self._cache = cache
+        self._pending: list[tuple[str, BaseModel]] = []
+
+    def get(self, key: str, response_format: type[M]) -> M | None:
+        return None
+
+    def set(self, key: str, value: BaseModel):
+        self._pending.append((key, value))
+
+    def commit(self):
+        for key, value in self._pending:
+            self._cache.set(key, value)
+        self._pending.clear()
@@ -1,16 +1,25 @@
 import asyncio
+from collections import Counter
 from enum import Enum, StrEnum, auto
+from functools import cache
+import json
+import logging
 import textwrap
-import litellm
-from typing import Any, Generic, TypeVar
+import time
+from types import GenericAlias
+from typing import Any, Callable, Generic, TypeVar
 
-from litellm.types.utils import ModelResponse
 from pydantic import BaseModel, create_model, model_serializer
 
-from .receipt import Receipt, ReceiptEntry, TranscribedReceipt
-from .statement import Transaction
+from .receipt import Receipt, ReceiptEntry, TranscribedReceipt, TranscribedReceipts
+from .statement import Transaction, TranscribedStatement, TranscribedStatements
 from .pair import TransactionReceiptPair
 from .config import Config
+from .llm import structured_completion
+from .memo import CategoryMemo
+from .metrics import Metrics
+from .ratelimit import estimate_tokens
+from .vendor import normalize_vendor
 
 DEFAULT_CATEGORIES = [
     "GROCERIES",
@@ -66,6 +75,7 @@ class CategorizedReceipt(Receipt):
             datetime=transcribed_receipt.datetime,
             subtotal=transcribed_receipt.subtotal,
             grand_total=transcribed_receipt.grand_total,
+            source_files=transcribed_receipt.source_files,
             items=categorized_entries,
         )
 
@@ -85,16 +95,22 @@ class CategorizedTransactionReceiptPair(BaseModel):
 
 
 async def categorize_pairs(
-    pairs: list[TransactionReceiptPair], categories_enum: type[Enum]
+    pairs: list[TransactionReceiptPair],
+    categories_enum: type[Enum],
+    category_memo: CategoryMemo | None = None,
 ) -> list[CategorizedTransactionReceiptPair]:
     transactions, receipts = (
         TransactionReceiptPair.extract_transactions(pairs),
         TransactionReceiptPair.extract_receipts(pairs),
     )
-    categorized_transactions = await categorize_transactions(
-        transactions, categories_enum
+    # NOTE: transactions and receipts share one limit so total in-flight requests stay bounded
+    semaphore = asyncio.Semaphore(Config.get_config().categorization_concurrency)
+    categorized_transactions, categorized_receipts = await asyncio.gather(
+        categorize_transactions(
+            transactions, categories_enum, category_memo, semaphore
+        ),
+        categorize_receipts(receipts, categories_enum, category_memo, semaphore),
     )
-    categorized_receipts = await categorize_receipts(receipts, categories_enum)
 
     return [
         CategorizedTransactionReceiptPair.from_transaction_receipt_pair(
@@ -117,6 +133,11 @@ class Categories(BaseModel):
     categories: list[Category]
 
 
+def list_of(model: type[BaseModel]) -> Any:
+    # NOTE: list[model] for a model built with create_model, type checkers reject a variable in list[...]
+    return GenericAlias(list, (model,))
+
+
 def get_categories_basemodel(categories_enum: type[Enum]) -> type[Categories]:
     category_basemodel = create_model(
         "Category",
@@ -126,15 +147,241 @@ def get_categories_basemodel(categories_enum: type[Enum]) -> type[Categories]:
     )
     return create_model(
         "Categories",
-        categories=list[category_basemodel],
+        categories=list_of(category_basemodel),
         __base__=Categories,
     )
 
 
+# NOTE: cached so every chunk of a run shares one fused schema, and with it one transcription cache key
+@cache
+def get_fused_receipts_basemodel(
+    categories_enum: type[Enum],
+) -> type[TranscribedReceipts]:
+    entry_basemodel = create_model(
+        "ReceiptEntry", category=categories_enum, __base__=ReceiptEntry
+    )
+    receipt_basemodel = create_model(
+        "TranscribedReceipt",
+        items=list_of(entry_basemodel),
+        __base__=TranscribedReceipt,
+    )
+    return create_model(
+        "TranscribedReceipts",
+        transcribed_receipts=list_of(receipt_basemodel),
+        __base__=TranscribedReceipts,
+    )
+
+
+@cache
+def get_fused_statements_basemodel(
+    categories_enum: type[Enum],
+) -> type[TranscribedStatements]:
+    transaction_basemodel = create_model(
+        "Transaction", category=categories_enum, __base__=Transaction
+    )
+    statement_basemodel = create_model(
+        "TranscribedStatement",
+        transactions=list_of(transaction_basemodel),
+        __base__=TranscribedStatement,
+    )
+    return create_model(
+        "TranscribedStatements",
+        transcribed_statements=list_of(statement_basemodel),
+        __base__=TranscribedStatements,
+    )
+
+
 def get_user_notes() -> str:
     return Config.get_config().categorization_notes or ""
 
 
+def get_categorization_context(categories_enum: type[Enum]) -> str:
+    return json.dumps(
+        [
+            sorted(str(category.value) for category in categories_enum),
+            get_user_notes(),
+            Config.get_config().categorization_model,
+        ]
+    )
+
+
+def _memo_text(name: str) -> str:
+    return normalize_vendor(name) or " ".join(name.lower().split())
+
+
+def transaction_memo_key(transaction: Transaction, context: str) -> str:
+    direction = "withdrawl" if transaction.withdrawl_amount is not None else "deposit"
+    return CategoryMemo.key(
+        "transaction", _memo_text(transaction.name), direction, context
+    )
+
+
+def receipt_entry_memo_key(
+    vendor: str, receipt_entry: ReceiptEntry, context: str
+) -> str:
+    return CategoryMemo.key(
+        "receipt_entry",
+        " ".join(receipt_entry.name.lower().split()),
+        _memo_text(vendor),
+        context,
+    )
+
+
+def _to_category(categories_enum: type[Enum], value: str | None) -> Enum | None:
+    if value is None:
+        return None
+    try:
+        return categories_enum(value)
+    except ValueError:
+        return None
+
+
+async def _request_categories(
+    system_prompt: str,
+    rows: list[str],
+    categories_basemodel: type[Categories],
+) -> Categories:
+    user_message = "\n\n".join(
+        f"<index>\n{i}\n</index>\n{row}" for i, row in enumerate(rows, start=1)
+    )
+    messages: list[dict] = [
+        {"content": system_prompt, "role": "system"},
+        {"role": "user", "content": user_message},
+    ]
+    # NOTE: each returned category is roughly a dozen output tokens
+    return await structured_completion(
+        Config.get_config().categorization_model,
+        messages,
+        categories_basemodel,
+        expected_output_tokens=12 * len(rows),
+    )
+
+
+def pack_rows(
+    rows: list[str], indices: list[int], max_rows: int, max_tokens: int
+) -> list[list[int]]:
+    chunks: list[list[int]] = []
+    chunk: list[int] = []
+    chunk_tokens = 0
+    for i in indices:
+        row_tokens = estimate_tokens(rows[i])
+        if chunk and (len(chunk) >= max_rows or chunk_tokens + row_tokens > max_tokens):
+            chunks.append(chunk)
+            chunk, chunk_tokens = [], 0
+        chunk.append(i)
+        chunk_tokens += row_tokens
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+async def categorize_rows(
+    system_prompt: str,
+    rows: list[str],
+    categories_basemodel: type[Categories],
+    semaphore: asyncio.Semaphore | None = None,
+    category_memo: CategoryMemo | None = None,
+    memo_keys: list[str] | None = None,
+) -> list[Enum]:
+    config = Config.get_config()
+    chunk_size = max(config.categorization_chunk_size, 1)
+    semaphore = semaphore or asyncio.Semaphore(config.categorization_concurrency)
+    categories: list[Enum | None] = [None] * len(rows)
+
+    async def request_chunk(chunk: list[int]):
+        queued_at = time.perf_counter()
+        async with semaphore:
+            Metrics.get_metrics().record_queue_wait(time.perf_counter() - queued_at)
+            try:
+                validated_categories = await _request_categories(
+                    system_prompt, [rows[i] for i in chunk], categories_basemodel
+                )
+            except Exception:
+                # NOTE: a failed request leaves its rows pending, so other chunks' results are kept
+                logging.exception(
+                    "Categorization request for %d rows failed", len(chunk)
+                )
+                return
+
+        # NOTE: an index has to come back exactly once, duplicates are as good as missing
+        index_counts = Counter(
+            category.index for category in validated_categories.categories
+        )
+        for category in validated_categories.categories:
+            if index_counts[category.index] == 1 and 1 <= category.index <= len(chunk):
+                categories[chunk[category.index - 1]] = category.category
+
+        # NOTE: memoized as each chunk lands, so a run that dies part way resumes from here
+        if category_memo and memo_keys:
+            category_memo.set_many(
+                [
+                    (memo_keys[i], str(chunk_category.value))
+                    for i in chunk
+                    if (chunk_category := categories[i]) is not None
+                ]
+            )
+
+    pending = list(range(len(rows)))
+    for attempt in range(config.categorization_retries + 1):
+        if attempt:
+            Metrics.get_metrics().increment("categorization_retries", len(pending))
+            logging.warning(
+                "Retrying categorization of %d rows (attempt %d)", len(pending), attempt
+            )
+
+        chunks = pack_rows(
+            rows, pending, chunk_size, config.categorization_max_tokens_per_request
+        )
+        await asyncio.gather(*(request_chunk(chunk) for chunk in chunks))
+        pending = [i for i in pending if categories[i] is None]
+        if not pending:
+            break
+
+    if pending:
+        raise ValueError(f"Categorization did not return rows {pending}")
+    return [category for category in categories if category is not None]
+
+
+def get_fused_categorize_prompt() -> str:
+    return textwrap.dedent(
+        f"""
+        Also categorize every transaction and receipt item based on the category field in the JSON schema provided.
+
+        {get_user_notes()}
+        """
+    ).strip()
+
+
+def remember_fused_categories(
+    receipts: TranscribedReceipts,
+    statements: TranscribedStatements,
+    categories_enum: type[Enum],
+    category_memo: CategoryMemo,
+):
+    # NOTE: stored under the keys categorize_pairs looks up, so only rows without a category are sent afterwards
+    context = get_categorization_context(categories_enum)
+    entries: list[tuple[str, str]] = []
+    for statement in statements.transcribed_statements:
+        for transaction in statement.transactions:
+            category = getattr(transaction, "category", None)
+            if isinstance(category, categories_enum):
+                entries.append(
+                    (transaction_memo_key(transaction, context), str(category.value))
+                )
+    for receipt in receipts.transcribed_receipts:
+        for receipt_entry in receipt.items:
+            category = getattr(receipt_entry, "category", None)
+            if isinstance(category, categories_enum):
+                entries.append(
+                    (
+                        receipt_entry_memo_key(receipt.vendor, receipt_entry, context),
+                        str(category.value),
+                    )
+                )
+    category_memo.set_many(entries)
+    Metrics.get_metrics().increment("fused_categories", len(entries))
+
+
 def get_statement_categorize_prompt() -> str:
     return textwrap.dedent(
         f"""
@@ -145,36 +392,59 @@ def get_statement_categorize_prompt() -> str:
     ).strip()
 
 
+async def categorize_memoized(
+    count: int,
+    prompt: str,
+    row: Callable[[int], str],
+    memo_key: Callable[[int, str], str],
+    categories_enum: type[Enum],
+    category_memo: CategoryMemo | None,
+    semaphore: asyncio.Semaphore | None,
+) -> list[Enum]:
+    categories: list[Enum | None] = [None] * count
+    memo_keys: list[str] = []
+    if category_memo:
+        context = get_categorization_context(categories_enum)
+        memo_keys = [memo_key(i, context) for i in range(count)]
+        categories = [
+            _to_category(categories_enum, category)
+            for category in category_memo.get_many(memo_keys)
+        ]
+
+    uncached = [i for i, category in enumerate(categories) if category is None]
+    if uncached:
+        uncached_categories = await categorize_rows(
+            prompt,
+            [row(i) for i in uncached],
+            get_categories_basemodel(categories_enum),
+            semaphore,
+            category_memo,
+            [memo_keys[i] for i in uncached] if category_memo else None,
+        )
+        for i, category in zip(uncached, uncached_categories):
+            categories[i] = category
+
+    return [category for category in categories if category is not None]
+
+
 async def categorize_transactions(
     transactions: list[Transaction],
     categories_enum: type[Enum],
+    category_memo: CategoryMemo | None = None,
+    semaphore: asyncio.Semaphore | None = None,
 ) -> list[Categorized[Transaction]]:
-    categories_basemodel = get_categories_basemodel(categories_enum)
-    system_prompt = get_statement_categorize_prompt()
-    user_message = "\n\n".join(
-        f"<index>\n{i}\n</index>\n<transaction>\n{transaction.model_dump_json()}\n</transaction>"
-        for i, transaction in enumerate(transactions, start=1)
-    )
-    messages: list[dict] = [
-        {"content": system_prompt, "role": "system"},
-        {"role": "user", "content": user_message},
-    ]
-    response = await litellm.acompletion(
-        model=Config.get_config().categorization_model,
-        messages=messages,
-        response_format=categories_basemodel,
-        temperature=0,
-    )
-    assert isinstance(response, ModelResponse)
-    assert isinstance(response.choices[0], litellm.Choices)
-    assert response.choices[0].message.content is not None
-
-    validated_categories = categories_basemodel.model_validate_json(
-        response.choices[0].message.content
+    categories = await categorize_memoized(
+        len(transactions),
+        get_statement_categorize_prompt(),
+        lambda i: f"<transaction>\n{transactions[i].model_dump_json()}\n</transaction>",
+        lambda i, context: transaction_memo_key(transactions[i], context),
+        categories_enum,
+        category_memo,
+        semaphore,
     )
     return [
-        Categorized(content=transaction, category=category.category)
-        for transaction, category in zip(transactions, validated_categories.categories)
+        Categorized(content=transaction, category=category)
+        for transaction, category in zip(transactions, categories, strict=True)
     ]
 
 
@@ -189,48 +459,46 @@ def get_receipt_categorize_prompt() -> str:
 
 
 async def categorize_receipts(
-    receipts: list[TranscribedReceipt | None], categories_enum: type[Enum]
+    receipts: list[TranscribedReceipt | None],
+    categories_enum: type[Enum],
+    category_memo: CategoryMemo | None = None,
+    semaphore: asyncio.Semaphore | None = None,
 ) -> list[CategorizedReceipt | None]:
-    categories_basemodel = get_categories_basemodel(categories_enum)
-    return await asyncio.gather(
-        *(categorize_receipt(receipt, categories_basemodel) for receipt in receipts)
-    )
+    entry_indices = [
+        (receipt_i, item_i)
+        for receipt_i, receipt in enumerate(receipts)
+        if receipt is not None
+        for item_i in range(len(receipt.items))
+    ]
 
+    def entry(receipt_i: int, item_i: int) -> tuple[str, ReceiptEntry]:
+        receipt = receipts[receipt_i]
+        assert receipt is not None
+        return receipt.vendor, receipt.items[item_i]
+
+    def row(i: int) -> str:
+        vendor, receipt_entry = entry(*entry_indices[i])
+        return f"<vendor>\n{vendor}\n</vendor>\n<receipt_entry>\n{receipt_entry.model_dump_json()}\n</receipt_entry>"
+
+    categories = await categorize_memoized(
+        len(entry_indices),
+        get_receipt_categorize_prompt(),
+        row,
+        lambda i, context: receipt_entry_memo_key(*entry(*entry_indices[i]), context),
+        categories_enum,
+        category_memo,
+        semaphore,
+    )
 
-async def categorize_receipt(
-    receipt: TranscribedReceipt | None, categories_basemodel: type[Categories]
-) -> CategorizedReceipt | None:
-    if receipt is None:
-        return None
+    categorized_entries: list[list[Categorized[ReceiptEntry]]] = [[] for _ in receipts]
+    for (receipt_i, item_i), category in zip(entry_indices, categories, strict=True):
+        categorized_entries[receipt_i].append(
+            Categorized(content=entry(receipt_i, item_i)[1], category=category)
+        )
 
-    system_prompt = get_receipt_categorize_prompt()
-    receipt_input = [
-        f"<index>\n{i}\n</index>\n<vendor>\n{receipt.vendor}\n</vendor>\n<receipt_entry>\n{receipt_entry.model_dump_json()}\n</receipt_entry>"
-        for i, receipt_entry in enumerate(receipt.items, start=1)
-    ]
-    user_message = "\n\n".join(
-        receipt_str for receipt_str in receipt_input if receipt_str
-    )
-    messages: list[dict] = [
-        {"content": system_prompt, "role": "system"},
-        {"role": "user", "content": user_message},
-    ]
-    response = await litellm.acompletion(
-        model=Config.get_config().categorization_model,
-        messages=messages,
-        response_format=categories_basemodel,
-        temperature=0,
-    )
-    assert isinstance(response, ModelResponse)
-    assert isinstance(response.choices[0], litellm.Choices)
-    assert response.choices[0].message.content is not None
-    validated_categories = categories_basemodel.model_validate_json(
-        response.choices[0].message.content
-    )
-
-    categorized_entries = [
-        Categorized(content=item, category=category.category)
-        for item, category in zip(receipt.items, validated_categories.categories)
+    return [
+        CategorizedReceipt.from_transcribed_receipt(receipt, entries)
+        if receipt is not None
+        else None
+        for receipt, entries in zip(receipts, categorized_entries)
     ]
-
-    return CategorizedReceipt.from_transcribed_receipt(receipt, categorized_entries)
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+import sys
+import time
+from typing import Any
+
+from .cache import TranscriptionCache
+from .config import get_app_dir
+from .pair import TransactionReceiptPair
+
+
+def get_checkpoint_dir(output_path: str) -> Path:
+    digest = hashlib.sha256(str(Path(output_path).resolve()).encode()).hexdigest()
+    return (
+        get_app_dir("XDG_STATE_HOME", Path.home() / ".local" / "state")
+        / "checkpoints"
+        / digest[:16]
+    )
+
+
+def _write_json_atomic(path: Path, value: Any):
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(value, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class RunCheckpoint:
+    def __init__(self, checkpoint_dir: Path, run_args: dict[str, Any], resume: bool):
+        self._dir = checkpoint_dir
+        state_path = self._dir / "state.json"
+        state = json.loads(state_path.read_text()) if state_path.exists() else None
+
+        if resume and state is not None:
+            if state["args"] != run_args:
+                raise ValueError(
+                    f"Checkpoint in {self._dir} was created with different arguments, run without --resume to start over"
+                )
+            logging.info("Resuming run checkpointed in %s", self._dir)
+            self.started_at: float = state["started_at"]
+            return
+
+        if resume:
+            logging.warning(
+                "No checkpoint to resume in %s, starting a new run", self._dir
+            )
+        elif state is not None:
+            logging.warning(
+                "Discarding checkpoint of an unfinished run in %s, pass --resume to continue it",
+                self._dir,
+            )
+        shutil.rmtree(self._dir, ignore_errors=True)
+        self._dir.mkdir(parents=True)
+        self.started_at = time.time()
+        _write_json_atomic(
+            state_path, {"started_at": self.started_at, "args": run_args}
+        )
+
+    def transcription_cache(self) -> TranscriptionCache:
+        # NOTE: stands in for the transcription cache under --no-cache, only lives as long as the run
+        return TranscriptionCache(self._dir / "transcriptions", max_bytes=sys.maxsize)
+
+    def memo_path(self) -> Path:
+        return self._dir / "memo.sqlite3"
+
+    def save_pairs(self, pairs: list[TransactionReceiptPair], pair_ids: list[str]):
+        _write_json_atomic(
+            self._dir / "pairs.json",
+            {
+                "pairs": [pair.model_dump(mode="json") for pair in pairs],
+                "pair_ids": pair_ids,
+            },
+        )
+
+    def load_pairs(self) -> tuple[list[TransactionReceiptPair], list[str]] | None:
+        pairs_path = self._dir / "pairs.json"
+        if not pairs_path.exists():
+            return None
+        checkpointed = json.loads(pairs_path.read_text())
+        return [
+            TransactionReceiptPair.model_validate(pair)
+            for pair in checkpointed["pairs"]
+        ], checkpointed["pair_ids"]
+
+    def complete(self):
+        shutil.rmtree(self._dir, ignore_errors=True)
@@ -0,0 +1,188 @@
+from datetime import datetime, timezone
+import os
+from pathlib import Path
+from typing import Any
+
+COLUMNAR_FORMATS = {"parquet", "arrow"}
+
+PARQUET_MAGIC = b"PAR1"
+ARROW_MAGIC = b"ARROW1"
+
+TRANSACTION_FIELDS = ["name", "datetime", "withdrawl_amount", "deposit_amount"]
+RECEIPT_FIELDS = ["vendor", "datetime", "subtotal", "grand_total", "source_files"]
+ITEM_FIELDS = ["quantity", "name", "price"]
+
+
+def items_path(path: str) -> Path:
+    output_path = Path(path)
+    return output_path.with_name(f"{output_path.stem}.items{output_path.suffix}")
+
+
+def _to_timestamp(value: str | None) -> datetime | None:
+    # NOTE: one column can only hold one kind of timestamp, aware datetimes are stored as naive UTC
+    if value is None:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _from_timestamp(value: datetime | None) -> str | None:
+    return value.isoformat() if value is not None else None
+
+
+class ColumnarWriter:
+    def __init__(self, path: str, output_format: str):
+        self._path = path
+        self._output_format = output_format
+        self._transactions: dict[str, list[Any]] = {
+            column: []
+            for column in [
+                "id",
+                *TRANSACTION_FIELDS,
+                "category",
+                *(f"receipt_{field}" for field in RECEIPT_FIELDS),
+            ]
+        }
+        self._items: dict[str, list[Any]] = {
+            column: [] for column in ["pair_id", *ITEM_FIELDS, "category"]
+        }
+        self._categorized = False
+
+    def write(self, pair_json: dict[str, Any]):
+        transaction, receipt = pair_json["transaction"], pair_json.get("receipt")
+        self._categorized |= "category" in transaction
+
+        self._transactions["id"].append(pair_json["id"])
+        for field in TRANSACTION_FIELDS:
+            self._transactions[field].append(transaction.get(field))
+        self._transactions["datetime"][-1] = _to_timestamp(transaction["datetime"])
+        self._transactions["category"].append(transaction.get("category"))
+        for field in RECEIPT_FIELDS:
+            self._transactions[f"receipt_{field}"].append(
+                receipt.get(field) if receipt else None
+            )
+        if receipt:
+            self._transactions["receipt_datetime"][-1] = _to_timestamp(
+                receipt["datetime"]
+            )
+
+        for item in receipt.get("items", []) if receipt else []:
+            self._items["pair_id"].append(pair_json["id"])
+            for field in ITEM_FIELDS:
+                self._items[field].append(item.get(field))
+            self._items["category"].append(item.get("category"))
+
+    def _tables(self) -> tuple[Any, Any]:
+        import pyarrow as pa
+
+        category = pa.dictionary(pa.int32(), pa.string())
+        transactions_schema = pa.schema(
+            [
+                ("id", pa.string()),
+                ("name", pa.string()),
+                ("datetime", pa.timestamp("us")),
+                ("withdrawl_amount", pa.float64()),
+                ("deposit_amount", pa.float64()),
+                ("category", category),
+                ("receipt_vendor", pa.string()),
+                ("receipt_datetime", pa.timestamp("us")),
+                ("receipt_subtotal", pa.float64()),
+                ("receipt_grand_total", pa.float64()),
+                ("receipt_source_files", pa.list_(pa.string())),
+            ]
+        )
+        items_schema = pa.schema(
+            [
+                ("pair_id", pa.string()),
+                ("quantity", pa.int64()),
+                ("name", pa.string()),
+                ("price", pa.float64()),
+                ("category", category),
+            ]
+        )
+        transactions = pa.table(self._transactions, schema=transactions_schema)
+        items = pa.table(self._items, schema=items_schema)
+        if not self._categorized:
+            transactions = transactions.drop_columns(["category"])
+            items = items.drop_columns(["category"])
+        return transactions, items
+
+    def _outputs(self) -> list[tuple[Path, Path]]:
+        from .output import temp_output_path
+
+        return [
+            (temp_output_path(path), path)
+            for path in (Path(self._path), items_path(self._path))
+        ]
+
+    def close(self):
+        transactions, items = self._tables()
+        outputs = self._outputs()
+        for table, (tmp_path, _) in zip((transactions, items), outputs):
+            if self._output_format == "parquet":
+                import pyarrow.parquet as pq
+
+                pq.write_table(table, tmp_path, compression="zstd")
+            else:
+                import pyarrow as pa
+
+                with pa.ipc.new_file(
+                    str(tmp_path),
+                    table.schema,
+                    options=pa.ipc.IpcWriteOptions(compression="zstd"),
+                ) as writer:
+                    writer.write_table(table)
+        # NOTE: both tables are renamed into place only after both are written
+        for tmp_path, path in outputs:
+            os.replace(tmp_path, path)
+
+    def abort(self):
+        for tmp_path, _ in self._outputs():
+            tmp_path.unlink(missing_ok=True)
+
+
+def is_columnar_file(path: str) -> bool:
+    with open(path, "rb") as f:
+        magic = f.read(len(ARROW_MAGIC))
+    return magic.startswith(PARQUET_MAGIC) or magic == ARROW_MAGIC
+
+
+def _read_table(path: Path) -> Any:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    with open(path, "rb") as f:
+        is_parquet = f.read(len(PARQUET_MAGIC)) == PARQUET_MAGIC
+    if is_parquet:
+        return pq.read_table(path)
+    with pa.memory_map(str(path)) as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def load_columnar_pairs(path: str) -> list[dict[str, Any]]:
+    transactions = _read_table(Path(path)).to_pylist()
+    items_by_pair: dict[str, list[dict[str, Any]]] = {}
+    if items_path(path).exists():
+        for item in _read_table(items_path(path)).to_pylist():
+            pair_id = item.pop("pair_id")
+            if item.get("category") is None:
+                item.pop("category", None)
+            items_by_pair.setdefault(pair_id, []).append(item)
+
+    pairs: list[dict[str, Any]] = []
+    for row in transactions:
+        transaction = {field: row[field] for field in TRANSACTION_FIELDS}
+        transaction["datetime"] = _from_timestamp(transaction["datetime"])
+        if row.get("category") is not None:
+            transaction["category"] = row["category"]
+
+        receipt = None
+        if row["receipt_vendor"] is not None:
+            receipt = {field: row[f"receipt_{field}"] for field in RECEIPT_FIELDS}
+            receipt["datetime"] = _from_timestamp(receipt["datetime"])
+            receipt["source_files"] = receipt["source_files"] or []
+            receipt["items"] = items_by_pair.get(row["id"], [])
+        pairs.append({"transaction": transaction, "receipt": receipt, "id": row["id"]})
+    return pairs
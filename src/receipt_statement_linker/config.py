@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
 import tomllib
 import os
@@ -6,6 +6,8 @@ import logging
 
 _CONFIG: "Config | None" = None
 
+STATEMENT_EXTRACTORS = ["csv", "ofx", "pdf_text", "llm"]
+
 
 def set_logger():
     logging_level_envar_map = {
@@ -21,25 +23,70 @@ def set_logger():
     logging.basicConfig(level=logging_level)
 
 
+def get_app_dir(xdg_envar: str, fallback_base_dir: Path) -> Path:
+    xdg_dir = os.environ.get(xdg_envar)
+    base_dir = Path(xdg_dir) if xdg_dir else fallback_base_dir
+
+    app_dir = base_dir / "receipt_statement_linker"
+    app_dir.mkdir(parents=True, exist_ok=True)
+    return app_dir
+
+
 @dataclass
 class Config:
     categorization_notes: str | None = None
     transcription_model: str = "gemini/gemini-2.5-flash"
     categorization_model: str = "gemini/gemini-2.5-flash"
     matching_model: str = "gemini/gemini-2.5-flash"
+    fallback_model: str | None = None
+    match_date_window_days: int | None = None
+    matching_batch_size: int = 50
+    matching_strategy: str = "greedy"
+    match_amount_tolerance: float = 0.05
+    match_tip_tolerance: float = 0.25
+    match_min_score: float = 0.5
+    vendor_match_threshold: float = 0.85
+    vendor_mismatch_threshold: float = 0.1
+    vendor_aliases: dict[str, str] = field(default_factory=dict)
+    vendor_memo_ttl_days: int | None = 365
+    vendor_memo_max_entries: int = 100_000
+    category_memo_max_entries: int = 500_000
+    categorization_chunk_size: int = 100
+    categorization_concurrency: int = 8
+    categorization_retries: int = 2
+    categorization_max_tokens_per_request: int = 8000
+    rate_limits: dict[str, dict[str, int]] = field(default_factory=dict)
+    opentelemetry: bool = False
+    llm_retries: int = 4
+    llm_backoff_seconds: float = 1.0
+    llm_backoff_max_seconds: float = 30.0
+    llm_hedge_after_seconds: float | None = None
+    llm_validation_retries: int = 1
+    transcription_cache_max_bytes: int = 512 * 1024 * 1024
+    extraction_concurrency: int = 8
+    extraction_chunk_size: int = 1
+    statement_pages_per_request: int = 5
+    statement_reconcile_retries: int = 1
+    statement_extractors: list[str] = field(
+        default_factory=lambda: list(STATEMENT_EXTRACTORS)
+    )
+    receipt_total_tolerance: float = 0.05
+    validation_retries: int = 1
+    max_image_bytes: int = 4 * 1024 * 1024
+    max_image_dimension: int = 2048
+
+    def __post_init__(self):
+        unknown = set(self.statement_extractors) - set(STATEMENT_EXTRACTORS)
+        if unknown:
+            raise ValueError(
+                f"Unknown statement_extractors {sorted(unknown)}, expected any of {STATEMENT_EXTRACTORS}"
+            )
 
     @classmethod
     def get_config(cls) -> "Config":
         global _CONFIG
         if not _CONFIG:
-            xdg_data_config = os.environ.get("XDG_CONFIG_HOME")
-            base_dir = (
-                Path(xdg_data_config) if xdg_data_config else Path.home() / ".config"
-            )
-
-            app_dir = base_dir / "receipt_statement_linker"
-            app_dir.mkdir(parents=True, exist_ok=True)
-
+            app_dir = get_app_dir("XDG_CONFIG_HOME", Path.home() / ".config")
             config_file = app_dir / "config.toml"
 
             try:
@@ -1,52 +1,256 @@
-from litellm.types.utils import ModelResponse
-import mimetypes
-
+import asyncio
+from enum import Enum
+import logging
+import time
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Iterator, TypeVar
+
+from pydantic import BaseModel
+
+from .cache import DeferredTranscriptionCache, TranscriptionCache
+from .categorize import (
+    get_fused_categorize_prompt,
+    get_fused_receipts_basemodel,
+    get_fused_statements_basemodel,
+)
 from .config import Config
+from .llm import structured_completion
 
+from .match import (
+    ReceiptIndex,
+    batch_vendor_match,
+    match_date_window,
+    scored_match,
+)
+from .memo import VendorMemo
+from .metrics import Metrics
 from .pair import TransactionReceiptPair
+from .statement_parsers import StatementExtractor, parse_statement
+from .validate import (
+    invalid_sources,
+    receipt_issues,
+    replace_improved,
+    statement_issues,
+)
+from .vendor import LocalVendorMatcher
 
 from .statement import (
+    Transaction,
+    TranscribedStatement,
     TranscribedStatements,
+    balance_reconciles,
+)
+from .receipt import (
+    FileInput,
+    TranscribedReceipt,
+    TranscribedReceipts,
+    get_mimetype as get_mimetype,
 )
-from .receipt import FileInput, TranscribedReceipt, TranscribedReceipts
 import textwrap
-import litellm
-
-
-litellm.enable_json_schema_validation
 
+M = TypeVar("M", bound=BaseModel)
+T = TypeVar("T")
+R = TypeVar("R")
+S = TypeVar("S", TranscribedReceipt, TranscribedStatement)
+
+RECEIPT_SYSTEM_PROMPT = textwrap.dedent(
+    """
+    You are an accurate receipt transcriber. You will be given image(s) of receipt(s). You will convert it to JSON output based on the schema provided.
+
+    NOTES:
+        - Ensure your datetime value is correct and in ISO 8601 format (YYYY-MM-DD HH:MM:SS.sssZ)
+        - Item name is to be just the name. Do not include quantity in the name. Quantity has its own field.
+    """
+).strip()
+
+STATEMENT_SYSTEM_PROMPT = textwrap.dedent(
+    """
+    You are an accurate bank statement transcriber. You will be given bank statement(s). You will convert it to JSON output based on the schema provided.
+
+    NOTES:
+        - Ensure your datetime value is correct and in ISO 8601 format (YYYY-MM-DD HH:MM:SS.sssZ).
+        - Do not include opening and closing balances in transactions. They belong in their respective fields.
+    """
+).strip()
+
+STATEMENT_PAGES_SYSTEM_PROMPT = textwrap.dedent(
+    """
+    You are an accurate bank statement transcriber. You will be given a range of pages from a bank statement. You will convert it to JSON output based on the schema provided.
+
+    NOTES:
+        - Ensure your datetime value is correct and in ISO 8601 format (YYYY-MM-DD HH:MM:SS.sssZ).
+        - Do not include opening and closing balances in transactions. They belong in their respective fields.
+        - opening_balance is the balance before the first transaction on these pages and closing_balance is the balance after the last transaction on these pages. Use the statement's running balance or balance forward lines for these. If they are not shown on these pages, leave them null.
+    """
+).strip()
+
+
+def _fused_system_prompt(system_prompt: str, categories_enum: type[Enum] | None) -> str:
+    if categories_enum is None:
+        return system_prompt
+    return f"{system_prompt}\n\n{get_fused_categorize_prompt()}"
+
+
+async def _cached_to_json(
+    files: list[FileInput],
+    to_json: Callable[[list[FileInput]], Awaitable[M]],
+    response_format: type[M],
+    system_prompt: str,
+    cache: TranscriptionCache,
+) -> M:
+    key = TranscriptionCache.key(
+        files, Config.get_config().transcription_model, system_prompt, response_format
+    )
+    cached = cache.get(key, response_format)
+    if cached is not None:
+        return cached
+
+    transcribed = await to_json(files)
+    cache.set(key, transcribed)
+    return transcribed
+
+
+def iter_chunks(items: Iterable[T], chunk_size: int) -> Iterator[list[T]]:
+    chunk: list[T] = []
+    for item in items:
+        chunk.append(item)
+        if 0 < chunk_size <= len(chunk):
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def run_work_queue(
+    items: Iterable[T],
+    handle: Callable[[list[T]], Awaitable[R | None]],
+    chunk_size: int,
+    workers: int,
+) -> list[tuple[list[T], R]]:
+    # NOTE: results come back in input order, chunks whose handler returned None are dropped
+    workers = max(workers, 1)
+    queue: asyncio.Queue[tuple[int, list[T]] | None] = asyncio.Queue(
+        maxsize=workers * 2
+    )
+    results: list[tuple[int, list[T], R]] = []
+
+    async def produce():
+        try:
+            for chunk_i, chunk in enumerate(iter_chunks(items, chunk_size)):
+                await queue.put((chunk_i, chunk))
+        finally:
+            for _ in range(workers):
+                await queue.put(None)
+
+    async def consume():
+        while (work := await queue.get()) is not None:
+            chunk_i, chunk = work
+            result = await handle(chunk)
+            if result is not None:
+                results.append((chunk_i, chunk, result))
+
+    await asyncio.gather(produce(), *(consume() for _ in range(workers)))
+    results.sort(key=lambda result: result[0])
+    return [(chunk, result) for _, chunk, result in results]
+
+
+async def _extract_chunks(
+    files: Iterable[FileInput],
+    to_json: Callable[[list[FileInput]], Awaitable[M]],
+    response_format: type[M],
+    system_prompt: str,
+    cache: TranscriptionCache | None,
+    semaphore: asyncio.Semaphore | None,
+) -> list[tuple[list[FileInput], M]]:
+    config = Config.get_config()
+    semaphore = semaphore or asyncio.Semaphore(config.extraction_concurrency)
+
+    async def extract_chunk(chunk: list[FileInput]) -> M | None:
+        queued_at = time.perf_counter()
+        async with semaphore:
+            Metrics.get_metrics().record_queue_wait(time.perf_counter() - queued_at)
+            try:
+                if cache is None:
+                    return await to_json(chunk)
+                return await _cached_to_json(
+                    chunk, to_json, response_format, system_prompt, cache
+                )
+            except Exception:
+                logging.error(
+                    "Extraction failed for %s",
+                    ", ".join(file.filepath for file in chunk),
+                    exc_info=True,
+                )
+                return None
+
+    return await run_work_queue(
+        files,
+        extract_chunk,
+        config.extraction_chunk_size,
+        config.extraction_concurrency,
+    )
 
-# TODO: use enum and dispatcher to specify extractor?
-async def receipts_extract(receipts: list[FileInput]) -> TranscribedReceipts:
-    return await receipt_to_json(receipts)
 
+def _with_source_files(
+    transcribed_chunks: list[tuple[list[FileInput], M]],
+    transcribed_items: Callable[[M], list[S]],
+) -> list[tuple[list[FileInput], S]]:
+    sourced: list[tuple[list[FileInput], S]] = []
+    for chunk, transcribed in transcribed_chunks:
+        for item in transcribed_items(transcribed):
+            item.source_files = [file.filepath for file in chunk]
+            sourced.append((chunk, item))
+    return sourced
+
+
+async def receipts_extract(
+    receipts: Iterable[FileInput],
+    cache: TranscriptionCache | None = None,
+    semaphore: asyncio.Semaphore | None = None,
+    categories_enum: type[Enum] | None = None,
+) -> TranscribedReceipts:
+    system_prompt = _fused_system_prompt(RECEIPT_SYSTEM_PROMPT, categories_enum)
+    response_format = (
+        get_fused_receipts_basemodel(categories_enum)
+        if categories_enum is not None
+        else TranscribedReceipts
+    )
 
-def get_mimetype(filepath: str) -> str | None:
-    mime, _ = mimetypes.guess_type(filepath)
-    return mime
+    async def to_json(chunk: list[FileInput]) -> TranscribedReceipts:
+        return await receipt_to_json(chunk, system_prompt, response_format)
 
+    transcribed_chunks = await _extract_chunks(
+        receipts,
+        to_json,
+        response_format,
+        system_prompt,
+        cache,
+        semaphore,
+    )
 
-async def receipt_to_json(receipts: list[FileInput]) -> TranscribedReceipts:
-    system_prompt = textwrap.dedent(
-        """
-        You are an accurate receipt transcriber. You will be given image(s) of receipt(s). You will convert it to JSON output based on the schema provided.
+    return TranscribedReceipts(
+        transcribed_receipts=[
+            transcribed_receipt
+            for _, transcribed_receipt in _with_source_files(
+                transcribed_chunks, lambda transcribed: transcribed.transcribed_receipts
+            )
+        ]
+    )
 
-        NOTES:
-            - Ensure your datetime value is correct and in ISO 8601 format (YYYY-MM-DD HH:MM:SS.sssZ)
-            - Item name is to be just the name. Do not include quantity in the name. Quantity has its own field.
-        """
-    ).strip()
 
-    image_mimetypes = [get_mimetype(receipt.filepath) for receipt in receipts]
-    for image_mimetype, receipt in zip(image_mimetypes, receipts):
-        if not image_mimetype:
+async def receipt_to_json(
+    receipts: list[FileInput],
+    system_prompt: str = RECEIPT_SYSTEM_PROMPT,
+    response_format: type[TranscribedReceipts] = TranscribedReceipts,
+) -> TranscribedReceipts:
+    for receipt in receipts:
+        if not receipt.mimetype:
             raise ValueError(f"{receipt.filepath} does not have valid image mimetype")
     receipts_content = [
         {
             "type": "image_url",
-            "image_url": {"url": f"data:{image_mimetype};base64,{receipt.b64}"},
+            "image_url": {"url": receipt.prepared().data_url()},
         }
-        for receipt, image_mimetype in zip(receipts, image_mimetypes)
+        for receipt in receipts
     ]
 
     messages: list[dict] = [
@@ -54,40 +258,283 @@ async def receipt_to_json(receipts: list[FileInput]) -> TranscribedReceipts:
         {"role": "user", "content": receipts_content},
     ]
 
-    response = await litellm.acompletion(
-        model=Config.get_config().transcription_model,
-        messages=messages,
-        response_format=TranscribedReceipts,
-        temperature=0,
+    return await structured_completion(
+        Config.get_config().transcription_model, messages, response_format
+    )
+
+
+async def statements_extract(
+    statements: Iterable[FileInput],
+    cache: TranscriptionCache | None = None,
+    semaphore: asyncio.Semaphore | None = None,
+    categories_enum: type[Enum] | None = None,
+) -> TranscribedStatements:
+    parsed: list[tuple[int, TranscribedStatement]] = []
+    positions: dict[int, int] = {}
+
+    def dispatch() -> Iterator[FileInput]:
+        send_to_model = (
+            StatementExtractor.LLM in Config.get_config().statement_extractors
+        )
+        metrics = Metrics.get_metrics()
+        for statement_i, statement in enumerate(statements):
+            extractor, transcribed_statement = parse_statement(statement)
+            if transcribed_statement is not None:
+                metrics.increment(f"statements_parsed_{extractor}")
+                transcribed_statement.source_files = [statement.filepath]
+                parsed.append((statement_i, transcribed_statement))
+            elif send_to_model:
+                metrics.increment("statements_sent_to_model")
+                positions[id(statement)] = statement_i
+                yield statement
+            else:
+                logging.warning(
+                    "No statement parser could read %s, skipping it", statement.filepath
+                )
+
+    transcribed = await _llm_statements_extract(
+        dispatch(), cache, semaphore, categories_enum
+    )
+    # NOTE: statements keep input order no matter which extractor read them
+    ordered = parsed + [
+        (positions[id(chunk[0])], transcribed_statement)
+        for chunk, transcribed_statement in transcribed
+    ]
+    ordered.sort(key=lambda item: item[0])
+    return TranscribedStatements(
+        transcribed_statements=[
+            transcribed_statement for _, transcribed_statement in ordered
+        ]
+    )
+
+
+async def _llm_statements_extract(
+    statements: Iterable[FileInput],
+    cache: TranscriptionCache | None,
+    semaphore: asyncio.Semaphore | None,
+    categories_enum: type[Enum] | None,
+) -> list[tuple[list[FileInput], TranscribedStatement]]:
+    config = Config.get_config()
+    response_format = (
+        get_fused_statements_basemodel(categories_enum)
+        if categories_enum is not None
+        else TranscribedStatements
+    )
+    if config.statement_pages_per_request > 0:
+        paged_semaphore = semaphore or asyncio.Semaphore(config.extraction_concurrency)
+
+        async def extract_paged(
+            chunk: list[FileInput],
+        ) -> TranscribedStatement | None:
+            [statement] = chunk
+            return await paged_statement_to_json(
+                statement, cache, paged_semaphore, categories_enum
+            )
+
+        return await run_work_queue(
+            statements, extract_paged, 1, config.extraction_concurrency
+        )
+
+    system_prompt = _fused_system_prompt(STATEMENT_SYSTEM_PROMPT, categories_enum)
+
+    async def to_json(chunk: list[FileInput]) -> TranscribedStatements:
+        return await statement_to_json(chunk, system_prompt, response_format)
+
+    transcribed_chunks = await _extract_chunks(
+        statements,
+        to_json,
+        response_format,
+        system_prompt,
+        cache,
+        semaphore,
+    )
+
+    return _with_source_files(
+        transcribed_chunks, lambda transcribed: transcribed.transcribed_statements
     )
 
-    # NOTE(Rehan):is there a better way to work around this for type checking? or is this just an unfortunate design decision by litellm??
-    # response can be ModelResponse or CustomStreamWrapper, latter doesn't have `choices` field...
-    assert isinstance(response, ModelResponse)
-    assert isinstance(response.choices[0], litellm.Choices)
-    assert response.choices[0].message.content is not None
 
-    return TranscribedReceipts.model_validate_json(response.choices[0].message.content)
+def _page_reconciles(
+    page_results: list[TranscribedStatements | None], page_i: int
+) -> bool:
+    page_result = page_results[page_i]
+    if page_result is None:
+        return False
+    if not page_result.transcribed_statements:
+        return True
+
+    page_statements = page_result.transcribed_statements
+    opening_balance = page_statements[0].opening_balance
+    # NOTE: pages often don't repeat the balance forward, fall back to the previous page's closing balance
+    previous_result = page_results[page_i - 1] if page_i > 0 else None
+    if (
+        opening_balance is None
+        and previous_result is not None
+        and previous_result.transcribed_statements
+    ):
+        opening_balance = previous_result.transcribed_statements[-1].closing_balance
+
+    return balance_reconciles(
+        opening_balance,
+        [
+            transaction
+            for page_statement in page_statements
+            for transaction in page_statement.transactions
+        ],
+        page_statements[-1].closing_balance,
+    )
 
 
-async def statements_extract(statements: list[FileInput]) -> TranscribedStatements:
-    return await statement_to_json(statements)
+def stitch_statement_pages(
+    page_results: list[TranscribedStatements],
+) -> TranscribedStatement:
+    page_statements = [
+        page_statement
+        for page_result in page_results
+        for page_statement in page_result.transcribed_statements
+    ]
+    return TranscribedStatement(
+        opening_balance=next(
+            (
+                page_statement.opening_balance
+                for page_statement in page_statements
+                if page_statement.opening_balance is not None
+            ),
+            None,
+        ),
+        transactions=[
+            transaction
+            for page_statement in page_statements
+            for transaction in page_statement.transactions
+        ],
+        closing_balance=next(
+            (
+                page_statement.closing_balance
+                for page_statement in reversed(page_statements)
+                if page_statement.closing_balance is not None
+            ),
+            None,
+        ),
+    )
 
 
-async def statement_to_json(statements: list[FileInput]) -> TranscribedStatements:
-    system_prompt = textwrap.dedent(
-        """
-        You are an accurate bank statement transcriber. You will be given bank statement(s). You will convert it to JSON output based on the schema provided.
+async def paged_statement_to_json(
+    statement: FileInput,
+    cache: TranscriptionCache | None,
+    semaphore: asyncio.Semaphore,
+    categories_enum: type[Enum] | None = None,
+) -> TranscribedStatement | None:
+    config = Config.get_config()
+    pages = statement.split_pages(config.statement_pages_per_request)
+    system_prompt = _fused_system_prompt(
+        STATEMENT_PAGES_SYSTEM_PROMPT if len(pages) > 1 else STATEMENT_SYSTEM_PROMPT,
+        categories_enum,
+    )
+    response_format = (
+        get_fused_statements_basemodel(categories_enum)
+        if categories_enum is not None
+        else TranscribedStatements
+    )
 
-        NOTES:
-            - Ensure your datetime value is correct and in ISO 8601 format (YYYY-MM-DD HH:MM:SS.sssZ).
-            - Do not include opening and closing balances in transactions. They belong in their respective fields.
-        """
-    ).strip()
+    async def pages_to_json(files: list[FileInput]) -> TranscribedStatements:
+        return await statement_to_json(files, system_prompt, response_format)
+
+    async def transcribe_pages(
+        page: FileInput, page_cache: TranscriptionCache | None
+    ) -> TranscribedStatements | None:
+        queued_at = time.perf_counter()
+        async with semaphore:
+            Metrics.get_metrics().record_queue_wait(time.perf_counter() - queued_at)
+            try:
+                if page_cache is None:
+                    return await pages_to_json([page])
+                return await _cached_to_json(
+                    [page],
+                    pages_to_json,
+                    response_format,
+                    system_prompt,
+                    page_cache,
+                )
+            except Exception:
+                logging.error(
+                    "Extraction failed for %s pages %s",
+                    statement.filepath,
+                    page.page_range or "all",
+                    exc_info=True,
+                )
+                return None
+
+    page_results = list(
+        await asyncio.gather(*(transcribe_pages(page, cache) for page in pages))
+    )
+
+    for attempt in range(1, config.statement_reconcile_retries + 1):
+        unreconciled = [
+            page_i
+            for page_i in range(len(pages))
+            if not _page_reconciles(page_results, page_i)
+        ]
+        if not unreconciled:
+            break
+
+        logging.warning(
+            "%s pages %s failed or do not reconcile, re-requesting (attempt %d)",
+            statement.filepath,
+            [pages[page_i].page_range or "all" for page_i in unreconciled],
+            attempt,
+        )
+        Metrics.get_metrics().increment(
+            "statement_reconcile_retries", len(unreconciled)
+        )
+        # NOTE: retries bypass the cache and only overwrite it when the retried page is kept
+        page_caches = {
+            page_i: DeferredTranscriptionCache(cache) if cache is not None else None
+            for page_i in unreconciled
+        }
+        retried_results = await asyncio.gather(
+            *(
+                transcribe_pages(pages[page_i], page_caches[page_i])
+                for page_i in unreconciled
+            )
+        )
+        for page_i, retried_result in zip(unreconciled, retried_results):
+            if retried_result is None:
+                continue
+            candidate_results = list(page_results)
+            candidate_results[page_i] = retried_result
+            if page_results[page_i] is None or _page_reconciles(
+                candidate_results, page_i
+            ):
+                page_results[page_i] = retried_result
+                if (page_cache := page_caches[page_i]) is not None:
+                    page_cache.commit()
+
+    transcribed_pages = [
+        page_result for page_result in page_results if page_result is not None
+    ]
+    if not transcribed_pages:
+        return None
+
+    transcribed_statement = stitch_statement_pages(transcribed_pages)
+    if len(transcribed_pages) < len(page_results):
+        logging.warning(
+            "%s is missing pages, dropping its balances", statement.filepath
+        )
+        transcribed_statement.opening_balance = None
+        transcribed_statement.closing_balance = None
+    transcribed_statement.source_files = [statement.filepath]
+    return transcribed_statement
+
+
+async def statement_to_json(
+    statements: list[FileInput],
+    system_prompt: str = STATEMENT_SYSTEM_PROMPT,
+    response_format: type[TranscribedStatements] = TranscribedStatements,
+) -> TranscribedStatements:
     statement_content = [
         {
             "type": "image_url",
-            "image_url": {"url": f"data:application/pdf;base64,{statement.b64}"},
+            "image_url": {"url": statement.data_url()},
         }
         for statement in statements
     ]
@@ -96,66 +543,237 @@ async def statement_to_json(statements: list[FileInput]) -> TranscribedStatement
         {"content": system_prompt, "role": "system"},
         {"role": "user", "content": statement_content},
     ]
-    response = await litellm.acompletion(
-        model=Config.get_config().transcription_model,
-        messages=messages,
-        response_format=TranscribedStatements,
-        temperature=0,
+    return await structured_completion(
+        Config.get_config().transcription_model, messages, response_format
     )
 
-    # COPYPASTA: receipt_to_json
-    # NOTE(Rehan):is there a better way to work around this for type checking? or is this just an unfortunate design decision by litellm??
-    # response can be ModelResponse or CustomStreamWrapper, latter doesn't have `choices` field...
-    assert isinstance(response, ModelResponse)
-    assert isinstance(response.choices[0], litellm.Choices)
-    assert response.choices[0].message.content is not None
 
-    return TranscribedStatements.model_validate_json(
-        response.choices[0].message.content
-    )
+async def reextract_invalid(
+    receipts: TranscribedReceipts,
+    statements: TranscribedStatements,
+    cache: TranscriptionCache | None = None,
+    semaphore: asyncio.Semaphore | None = None,
+    categories_enum: type[Enum] | None = None,
+) -> tuple[TranscribedReceipts, TranscribedStatements]:
+    metrics = Metrics.get_metrics()
+    for attempt in range(1, Config.get_config().validation_retries + 1):
+        invalid_receipts = invalid_sources(
+            receipts.transcribed_receipts, receipt_issues
+        )
+        invalid_statements = invalid_sources(
+            statements.transcribed_statements, statement_issues
+        )
+        if not invalid_receipts and not invalid_statements:
+            break
+
+        for source_files, issues in [
+            *invalid_receipts.items(),
+            *invalid_statements.items(),
+        ]:
+            logging.warning(
+                "%s failed validation, re-extracting (attempt %d): %s",
+                ", ".join(source_files),
+                attempt,
+                "; ".join(issues),
+            )
+        metrics.increment("validation_invalid_receipts", len(invalid_receipts))
+        metrics.increment("validation_invalid_statements", len(invalid_statements))
+
+        # NOTE: sent again as the exact chunks they came from, so replacements line up by source files
+        receipt_groups = list(invalid_receipts)
+        statement_groups = list(invalid_statements)
+        group_caches = {
+            source_files: DeferredTranscriptionCache(cache)
+            if cache is not None
+            else None
+            for source_files in receipt_groups + statement_groups
+        }
+        reextracted_receipts, reextracted_statements = await asyncio.gather(
+            asyncio.gather(
+                *(
+                    receipts_extract(
+                        (FileInput(file) for file in source_files),
+                        group_caches[source_files],
+                        semaphore,
+                        categories_enum,
+                    )
+                    for source_files in receipt_groups
+                )
+            ),
+            asyncio.gather(
+                *(
+                    statements_extract(
+                        (FileInput(file) for file in source_files),
+                        group_caches[source_files],
+                        semaphore,
+                        categories_enum,
+                    )
+                    for source_files in statement_groups
+                )
+            ),
+        )
+        merged_receipts, improved_receipts = replace_improved(
+            receipts.transcribed_receipts,
+            [
+                receipt
+                for transcribed in reextracted_receipts
+                for receipt in transcribed.transcribed_receipts
+            ],
+            receipt_issues,
+        )
+        merged_statements, improved_statements = replace_improved(
+            statements.transcribed_statements,
+            [
+                statement
+                for transcribed in reextracted_statements
+                for statement in transcribed.transcribed_statements
+            ],
+            statement_issues,
+        )
+        for source_files in improved_receipts | improved_statements:
+            if group_cache := group_caches.get(source_files):
+                group_cache.commit()
+        metrics.increment(
+            "validation_improved_documents",
+            len(improved_receipts) + len(improved_statements),
+        )
+        receipts = TranscribedReceipts(transcribed_receipts=merged_receipts)
+        statements = TranscribedStatements(transcribed_statements=merged_statements)
+    return receipts, statements
 
 
 async def merge_statements_receipts(
-    statements: TranscribedStatements, receipts: TranscribedReceipts
+    statements: TranscribedStatements,
+    receipts: TranscribedReceipts,
+    vendor_memo: VendorMemo | None = None,
 ) -> list[TransactionReceiptPair]:
+    return [
+        pair
+        async for pair in iter_merge_statements_receipts(
+            statements, receipts, vendor_memo
+        )
+    ]
+
+
+async def iter_merge_statements_receipts(
+    statements: TranscribedStatements,
+    receipts: TranscribedReceipts,
+    vendor_memo: VendorMemo | None = None,
+) -> AsyncIterator[TransactionReceiptPair]:
     # plan:
     # - match on price since likelihood of price matching exactly is low
     # - check if vendor match
     #   - we can do this the dumb way first (receipt vendor in )
-    pairs: list[TransactionReceiptPair] = []
-    receipts_copy = receipts.model_copy(deep=True)
-
-    for statement in statements.transcribed_statements:
-        for transaction in statement.transactions:
-            receipt: TranscribedReceipt | None = None
-            price_match_receipts = [
-                receipt
-                for receipt in receipts_copy.transcribed_receipts
-                if receipt.grand_total == transaction.withdrawl_amount
-            ]
-
-            if not price_match_receipts:
-                receipt = None
+    receipt_index = ReceiptIndex(receipts.transcribed_receipts, match_date_window())
+    transactions = [
+        transaction
+        for statement in statements.transcribed_statements
+        for transaction in statement.transactions
+    ]
 
-            elif len(price_match_receipts) == 1:
-                [receipt] = price_match_receipts
+    if Config.get_config().matching_strategy == "scored":
+        local_matcher = LocalVendorMatcher.get_matcher()
 
-            else:
-                name_match_receipt: TranscribedReceipt | None = None
-
-                # NOTE(Rehan): if multiple matches, we just hit the first
-                for price_match_receipt in price_match_receipts:
-                    if await price_match_receipt.vendor_match_transaction_name(
-                        transaction
-                    ):
-                        receipt = price_match_receipt
-                        break
-
-            # NOTE(Rehan): Skip cases where no name match
-            if receipt:
-                receipts_copy.transcribed_receipts.remove(receipt)
-            pairs.append(
-                TransactionReceiptPair(transaction=transaction, receipt=receipt)
+        def vendor_score(vendor: str, transaction_name: str) -> float:
+            # NOTE: memoized model decisions still count, but nothing new is sent to the matching model
+            decision = (
+                vendor_memo.get(vendor, transaction_name) if vendor_memo else None
+            )
+            if decision is not None:
+                return 1.0 if decision else 0.0
+            return local_matcher.score(vendor, transaction_name)
+
+        matching = scored_match(transactions, receipt_index, vendor_score)
+        for transaction_i, transaction in enumerate(transactions):
+            matched_i = matching.get(transaction_i)
+            yield TransactionReceiptPair(
+                transaction=transaction,
+                receipt=receipt_index[matched_i] if matched_i is not None else None,
+            )
+        return
+
+    def price_match(transaction: Transaction) -> list[int]:
+        if transaction.withdrawl_amount is None:
+            return []
+        return receipt_index.candidates(
+            transaction.withdrawl_amount, transaction.datetime
+        )
+
+    # NOTE: resolve every multi-candidate transaction up front in a few batched calls,
+    # consuming receipts below only ever shrinks these candidate lists
+    ambiguous: dict[int, list[int]] = {}
+    for transaction_i, transaction in enumerate(transactions):
+        candidates = price_match(transaction)
+        if len(candidates) > 1:
+            ambiguous[transaction_i] = candidates
+
+    local_matcher = LocalVendorMatcher.get_matcher()
+    name_matches: dict[int, set[int]] = {}
+    undecided: dict[int, list[int]] = {}
+    for transaction_i, candidates in ambiguous.items():
+        name_matches[transaction_i] = set()
+        for candidate in candidates:
+            vendor, transaction_name = (
+                receipt_index[candidate].vendor,
+                transactions[transaction_i].name,
+            )
+            local_decision = (
+                vendor_memo.get(vendor, transaction_name) if vendor_memo else None
+            )
+            if local_decision is None:
+                local_decision = local_matcher.decide(vendor, transaction_name)
+            if local_decision is None:
+                undecided.setdefault(transaction_i, []).append(candidate)
+            elif local_decision:
+                name_matches[transaction_i].add(candidate)
+
+    vendor_matches = await batch_vendor_match(
+        [
+            (transactions[transaction_i], [receipt_index[c] for c in candidates])
+            for transaction_i, candidates in undecided.items()
+        ]
+    )
+    model_decisions: list[tuple[str, str, bool]] = []
+    for (transaction_i, candidates), matches in zip(undecided.items(), vendor_matches):
+        for position, candidate in enumerate(candidates):
+            vendor, transaction_name = (
+                receipt_index[candidate].vendor,
+                transactions[transaction_i].name,
+            )
+            model_decisions.append((vendor, transaction_name, position in matches))
+            if position in matches:
+                name_matches[transaction_i].add(candidate)
+                local_matcher.learn(vendor, transaction_name)
+    if vendor_memo:
+        vendor_memo.set_many(model_decisions)
+    logging.info("Vendor matching stats: %s", local_matcher.stats_dict())
+    for name, value in local_matcher.stats_dict().items():
+        Metrics.get_metrics().counters[f"vendor_{name}"] = value
+
+    for transaction_i, transaction in enumerate(transactions):
+        receipt_i: int | None = None
+        price_match_receipts = price_match(transaction)
+
+        if not price_match_receipts:
+            receipt_i = None
+
+        elif len(price_match_receipts) == 1:
+            [receipt_i] = price_match_receipts
+
+        else:
+            # NOTE(Rehan): if multiple matches, we just hit the first
+            receipt_i = next(
+                (
+                    price_match_receipt_i
+                    for price_match_receipt_i in price_match_receipts
+                    if price_match_receipt_i in name_matches[transaction_i]
+                ),
+                None,
             )
 
-    return pairs
+        # NOTE(Rehan): Skip cases where no name match
+        receipt: TranscribedReceipt | None = None
+        if receipt_i is not None:
+            receipt_index.consume(receipt_i)
+            receipt = receipt_index[receipt_i]
+        yield TransactionReceiptPair(transaction=transaction, receipt=receipt)
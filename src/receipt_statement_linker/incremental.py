@@ -0,0 +1,80 @@
+import logging
+import os
+from typing import Any, Iterable, Iterator
+
+from .output import load_pairs
+from .receipt import FileInput
+from .statement import Transaction, TranscribedStatement, TranscribedStatements
+
+
+class PreviousRun:
+    def __init__(self, pairs: list[dict[str, Any]]):
+        pairs = [pair for pair in pairs if "id" in pair]
+        # NOTE: only matched pairs are kept as is, unmatched transactions are matched again against new receipts
+        self.pairs = [pair for pair in pairs if pair.get("receipt")]
+        self.unmatched_pairs = [pair for pair in pairs if not pair.get("receipt")]
+        self.pair_ids = {pair["id"] for pair in self.pairs}
+        self.matched_receipt_files = {
+            source_file
+            for pair in self.pairs
+            for source_file in pair["receipt"].get("source_files", [])
+        }
+
+    @classmethod
+    def load(cls, path: str) -> "PreviousRun":
+        if not os.path.exists(path):
+            logging.info("No previous output at %s, processing all inputs", path)
+            return cls([])
+        return cls(load_pairs(path))
+
+    def new_receipt_files(self, receipts: Iterable[FileInput]) -> Iterator[FileInput]:
+        # NOTE: receipts that were already paired can't pair again, unmatched ones are kept for new transactions
+        skipped = 0
+        for receipt in receipts:
+            if receipt.filepath in self.matched_receipt_files:
+                skipped += 1
+                continue
+            yield receipt
+        logging.info(
+            "Incremental run skipped %d already matched receipt files", skipped
+        )
+
+    def new_transactions(
+        self, statements: TranscribedStatements, pair_ids: list[str]
+    ) -> tuple[TranscribedStatements, list[str]]:
+        new_pair_ids: list[str] = []
+        new_statements: list[TranscribedStatement] = []
+        pair_ids_iter = iter(pair_ids)
+        for statement in statements.transcribed_statements:
+            transactions = []
+            for transaction, pair_id in zip(statement.transactions, pair_ids_iter):
+                if pair_id not in self.pair_ids:
+                    transactions.append(transaction)
+                    new_pair_ids.append(pair_id)
+            new_statements.append(
+                statement.model_copy(update={"transactions": transactions})
+            )
+
+        found = set(new_pair_ids)
+        carried = [pair for pair in self.unmatched_pairs if pair["id"] not in found]
+        if carried:
+            new_statements.append(
+                TranscribedStatement(
+                    opening_balance=None,
+                    transactions=[
+                        Transaction.model_validate(pair["transaction"])
+                        for pair in carried
+                    ],
+                    closing_balance=None,
+                )
+            )
+            new_pair_ids.extend(pair["id"] for pair in carried)
+
+        logging.info(
+            "Incremental run kept %d matched pairs, matching %d transactions",
+            len(self.pairs),
+            len(new_pair_ids),
+        )
+        return TranscribedStatements(
+            transcribed_statements=new_statements
+        ), new_pair_ids
@@ -0,0 +1,95 @@
+import glob
+import logging
+import os
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+from .receipt import FileInput, get_mimetype
+
+
+def is_document_mimetype(mimetype: str | None) -> bool:
+    return mimetype is not None and (
+        mimetype.startswith("image/") or mimetype == "application/pdf"
+    )
+
+
+def is_statement_mimetype(mimetype: str | None) -> bool:
+    return is_document_mimetype(mimetype) or mimetype in (
+        "text/csv",
+        "application/x-ofx",
+        "application/vnd.intu.qfx",
+    )
+
+
+def _walk_dir(dir_path: str) -> Iterator[str]:
+    for root, dirs, files in os.walk(dir_path):
+        dirs.sort()
+        for file in sorted(files):
+            yield os.path.join(root, file)
+
+
+def _read_manifest(manifest_path: str) -> Iterator[str]:
+    manifest_dir = Path(manifest_path).parent
+    with open(manifest_path) as manifest:
+        for line in manifest:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            yield str(manifest_dir / line)
+
+
+def iter_input_paths(specs: Iterable[str], manifests: Iterable[str]) -> Iterator[str]:
+    for spec in specs:
+        if os.path.isdir(spec):
+            yield from _walk_dir(spec)
+        elif glob.has_magic(spec):
+            for path in glob.iglob(spec, recursive=True):
+                if os.path.isdir(path):
+                    yield from _walk_dir(path)
+                else:
+                    yield path
+        else:
+            yield spec
+
+    for manifest_path in manifests:
+        for path in _read_manifest(manifest_path):
+            if os.path.isdir(path):
+                yield from _walk_dir(path)
+            else:
+                yield path
+
+
+class SkippedInputs:
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.skipped: list[tuple[str, str | None]] = []
+
+    def add(self, filepath: str, mimetype: str | None):
+        logging.debug("Skipping %s %s with mimetype %s", self.kind, filepath, mimetype)
+        self.skipped.append((filepath, mimetype))
+
+    def report(self):
+        if not self.skipped:
+            return
+        logging.warning(
+            "Skipped %d unsupported %s file(s): %s%s",
+            len(self.skipped),
+            self.kind,
+            ", ".join(
+                f"{filepath} ({mimetype})" for filepath, mimetype in self.skipped[:10]
+            ),
+            ", ..." if len(self.skipped) > 10 else "",
+        )
+
+
+def iter_file_inputs(
+    paths: Iterable[str],
+    is_supported: Callable[[str | None], bool],
+    skipped: SkippedInputs,
+) -> Iterator[FileInput]:
+    for path in paths:
+        mimetype = get_mimetype(path)
+        if not is_supported(mimetype):
+            skipped.add(path, mimetype)
+            continue
+        yield FileInput(path, mimetype=mimetype)
@@ -0,0 +1,150 @@
+import asyncio
+from typing import Any, Iterable, Sequence
+import weakref
+
+from pydantic import BaseModel
+
+from .cache import TranscriptionCache
+from .categorize import (
+    CategorizedTransactionReceiptPair,
+    categorize_pairs,
+    set_categories_enum,
+)
+from .config import Config
+from .extract import (
+    iter_merge_statements_receipts,
+    receipts_extract,
+    reextract_invalid,
+    statements_extract,
+)
+from .inputs import (
+    SkippedInputs,
+    is_document_mimetype,
+    is_statement_mimetype,
+    iter_file_inputs,
+    iter_input_paths,
+)
+from .memo import CategoryMemo, VendorMemo
+from .metrics import Metrics
+from .output import pair_to_json
+from .pair import TransactionReceiptPair, assign_pair_ids
+from .ratelimit import loop_local
+from .receipt import TranscribedReceipts
+from .statement import TranscribedStatements
+
+
+class Linker:
+    # NOTE: long-lived so concurrent jobs share the caches, memos and one request budget
+    def __init__(
+        self,
+        categories: list[str] | None = None,
+        use_cache: bool = True,
+        refresh: bool = False,
+    ):
+        self._categories = categories
+        self._cache = TranscriptionCache(refresh=refresh) if use_cache else None
+        self._vendor_memo = VendorMemo(refresh=refresh) if use_cache else None
+        self._category_memo = CategoryMemo(refresh=refresh) if use_cache else None
+        self._semaphores: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, asyncio.Semaphore
+        ] = weakref.WeakKeyDictionary()
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        return loop_local(
+            self._semaphores,
+            lambda: asyncio.Semaphore(Config.get_config().extraction_concurrency),
+        )
+
+    async def extract(
+        self, receipt_inputs: Iterable[str], statement_inputs: Iterable[str]
+    ) -> tuple[TranscribedReceipts, TranscribedStatements]:
+        metrics = Metrics.get_metrics()
+        semaphore = self._semaphore()
+        skipped_receipts, skipped_statements = (
+            SkippedInputs("receipt"),
+            SkippedInputs("statement"),
+        )
+        receipts, statements = await asyncio.gather(
+            metrics.timed(
+                "receipts_extract",
+                receipts_extract(
+                    iter_file_inputs(
+                        iter_input_paths(receipt_inputs, []),
+                        is_document_mimetype,
+                        skipped_receipts,
+                    ),
+                    self._cache,
+                    semaphore,
+                ),
+            ),
+            metrics.timed(
+                "statements_extract",
+                statements_extract(
+                    iter_file_inputs(
+                        iter_input_paths(statement_inputs, []),
+                        is_statement_mimetype,
+                        skipped_statements,
+                    ),
+                    self._cache,
+                    semaphore,
+                ),
+            ),
+        )
+        skipped_receipts.report()
+        skipped_statements.report()
+        return await metrics.timed(
+            "validate",
+            reextract_invalid(receipts, statements, self._cache, semaphore),
+        )
+
+    async def merge(
+        self, statements: TranscribedStatements, receipts: TranscribedReceipts
+    ) -> list[TransactionReceiptPair]:
+        with Metrics.get_metrics().stage("merge_statements_receipts"):
+            return [
+                pair
+                async for pair in iter_merge_statements_receipts(
+                    statements, receipts, self._vendor_memo
+                )
+            ]
+
+    async def categorize(
+        self,
+        pairs: list[TransactionReceiptPair],
+        categories: list[str] | None = None,
+    ) -> list[CategorizedTransactionReceiptPair]:
+        with Metrics.get_metrics().stage("categorize_pairs"):
+            return await categorize_pairs(
+                pairs,
+                set_categories_enum(categories or self._categories),
+                self._category_memo,
+            )
+
+    async def link(
+        self,
+        receipt_inputs: Iterable[str],
+        statement_inputs: Iterable[str],
+        categorize: bool = False,
+        categories: list[str] | None = None,
+    ) -> list[dict[str, Any]]:
+        receipts, statements = await self.extract(receipt_inputs, statement_inputs)
+        pair_ids = assign_pair_ids(statements)
+        pairs = await self.merge(statements, receipts)
+        output_pairs: Sequence[BaseModel] = (
+            await self.categorize(pairs, categories) if categorize else pairs
+        )
+        return [
+            pair_to_json(pair, pair_id) for pair, pair_id in zip(output_pairs, pair_ids)
+        ]
+
+    def close(self):
+        if self._vendor_memo:
+            self._vendor_memo.close()
+        if self._category_memo:
+            self._category_memo.close()
+
+    async def __aenter__(self) -> "Linker":
+        return self
+
+    async def __aexit__(self, *exc_info: object):
+        self.close()
@@ -0,0 +1,228 @@
+import asyncio
+from contextlib import nullcontext
+import logging
+import random
+import time
+from types import ModuleType
+from typing import Awaitable, Callable, TypeVar
+import weakref
+
+from pydantic import BaseModel, ValidationError
+
+from .config import Config
+from .metrics import Metrics, install_litellm_callback
+from .ratelimit import RateLimiter, estimate_tokens, loop_local
+
+_MODEL_SEMAPHORES: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, dict[str, asyncio.Semaphore | None]
+] = weakref.WeakKeyDictionary()
+
+# NOTE: what Gemini charges per image/PDF page, close enough for rate limit budgeting on other providers
+_FILE_PART_TOKENS = 258
+
+M = TypeVar("M", bound=BaseModel)
+T = TypeVar("T")
+
+
+class EmptyResponseError(Exception):
+    pass
+
+
+_RETRYABLE_ERRORS: tuple[type[Exception], ...] = ()
+
+
+def _get_litellm() -> ModuleType:
+    # NOTE: litellm takes seconds to import, runs answered from the cache and memos never load it
+    global _RETRYABLE_ERRORS
+    import litellm
+
+    if not _RETRYABLE_ERRORS:
+        install_litellm_callback()
+        # NOTE: anything else (bad request, auth, context window) fails the same way every time, so it is not retried
+        _RETRYABLE_ERRORS = (
+            litellm.RateLimitError,
+            litellm.ServiceUnavailableError,
+            litellm.InternalServerError,
+            litellm.APIConnectionError,
+            litellm.Timeout,
+            EmptyResponseError,
+        )
+    return litellm
+
+
+def _get_semaphore(model: str) -> asyncio.Semaphore | None:
+    semaphores = loop_local(_MODEL_SEMAPHORES, dict)
+    if model not in semaphores:
+        concurrency = Config.get_config().rate_limits.get(model, {}).get("concurrency")
+        semaphores[model] = asyncio.Semaphore(concurrency) if concurrency else None
+    return semaphores[model]
+
+
+def estimate_message_tokens(messages: list[dict]) -> int:
+    return sum(
+        estimate_tokens(message["content"])
+        if isinstance(message["content"], str)
+        else _FILE_PART_TOKENS * len(message["content"])
+        for message in messages
+    )
+
+
+async def _send(
+    model: str,
+    messages: list[dict],
+    response_format: type[BaseModel] | None,
+    expected_output_tokens: int,
+    attempt: int,
+) -> str:
+    litellm = _get_litellm()
+    from litellm.types.utils import ModelResponse
+
+    semaphore = _get_semaphore(model)
+    queued_at = time.perf_counter()
+    async with semaphore or nullcontext():
+        await RateLimiter.get_rate_limiter(model).acquire(
+            estimate_message_tokens(messages) + expected_output_tokens
+        )
+        Metrics.get_metrics().record_queue_wait(time.perf_counter() - queued_at)
+        response = await litellm.acompletion(
+            model=model,
+            messages=messages,
+            response_format=response_format,
+            temperature=0,
+            metadata={"attempt": attempt},
+        )
+
+    # NOTE(Rehan): response can be ModelResponse or CustomStreamWrapper, latter doesn't have `choices` field
+    assert isinstance(response, ModelResponse)
+    assert isinstance(response.choices[0], litellm.Choices)
+    if not response.choices[0].message.content:
+        raise EmptyResponseError(f"{model} returned an empty response")
+    return response.choices[0].message.content
+
+
+async def _hedged_send(
+    model: str,
+    messages: list[dict],
+    response_format: type[BaseModel] | None,
+    expected_output_tokens: int,
+    attempt: int,
+) -> str:
+    hedge_after = Config.get_config().llm_hedge_after_seconds
+
+    def send() -> asyncio.Task[str]:
+        return asyncio.ensure_future(
+            _send(model, messages, response_format, expected_output_tokens, attempt)
+        )
+
+    first = send()
+    if not hedge_after:
+        return await first
+
+    done, _ = await asyncio.wait({first}, timeout=hedge_after)
+    if done:
+        return first.result()
+
+    # NOTE: a slow request gets a duplicate, whichever answers first wins and the other is cancelled
+    Metrics.get_metrics().increment("llm_hedged_requests")
+    pending = {first, send()}
+    error: BaseException | None = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+    finally:
+        for task in pending:
+            task.cancel()
+    assert error is not None
+    raise error
+
+
+async def _send_with_retries(
+    model: str,
+    messages: list[dict],
+    response_format: type[BaseModel] | None,
+    expected_output_tokens: int,
+) -> str:
+    config = Config.get_config()
+    attempt = 0
+    while True:
+        try:
+            return await _hedged_send(
+                model, messages, response_format, expected_output_tokens, attempt
+            )
+        except _RETRYABLE_ERRORS as e:
+            if attempt >= config.llm_retries:
+                raise
+            delay = random.uniform(
+                0,
+                min(
+                    config.llm_backoff_max_seconds,
+                    config.llm_backoff_seconds * 2**attempt,
+                ),
+            )
+            attempt += 1
+            Metrics.get_metrics().increment("llm_retries")
+            logging.warning(
+                "%s request failed (%s), retry %d in %.1fs", model, e, attempt, delay
+            )
+            await asyncio.sleep(delay)
+
+
+async def _with_fallback(
+    model: str,
+    request: Callable[[str], Awaitable[T]],
+) -> T:
+    fallback_model = Config.get_config().fallback_model
+    # NOTE: _RETRYABLE_ERRORS is only filled in once litellm is loaded
+    _get_litellm()
+    fallback_errors: tuple[type[Exception], ...] = (*_RETRYABLE_ERRORS, ValidationError)
+    try:
+        return await request(model)
+    except fallback_errors as e:
+        if not fallback_model or fallback_model == model:
+            raise
+        Metrics.get_metrics().increment("llm_fallbacks")
+        logging.warning("%s failed (%s), falling back to %s", model, e, fallback_model)
+        return await request(fallback_model)
+
+
+async def structured_completion(
+    model: str,
+    messages: list[dict],
+    response_format: type[M],
+    expected_output_tokens: int = 0,
+) -> M:
+    validation_retries = Config.get_config().llm_validation_retries
+
+    async def request(model: str) -> M:
+        conversation = list(messages)
+        reask = 0
+        while True:
+            content = await _send_with_retries(
+                model, conversation, response_format, expected_output_tokens
+            )
+            try:
+                return response_format.model_validate_json(content)
+            except ValidationError as e:
+                if reask >= validation_retries:
+                    raise
+                reask += 1
+                # NOTE: only a response that doesn't fit the schema is re-asked, with the error to correct against
+                Metrics.get_metrics().increment("llm_validation_retries")
+                logging.warning(
+                    "%s response failed validation, re-asking: %s", model, e
+                )
+                conversation = conversation + [
+                    {"role": "assistant", "content": content},
+                    {
+                        "role": "user",
+                        "content": f"The response did not match the JSON schema:\n{e}\nRespond again with only JSON that matches the schema.",
+                    },
+                ]
+
+    return await _with_fallback(model, request)
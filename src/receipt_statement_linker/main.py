@@ -1,25 +1,40 @@
 import argparse
-import uuid
-import json
-import asyncio
+import importlib.util
+import logging
 
-from .config import set_logger
+from .columnar import COLUMNAR_FORMATS
+from .config import Config, set_logger
+from .metrics import Metrics
+from .output import OUTPUT_FORMATS, open_output_writer, pair_to_json
 
-from .categorize import categorize_pairs, set_categories_enum
-from .extract import merge_statements_receipts, receipts_extract, statements_extract
-from .receipt import FileInput
 
-
-async def _async_main():
-    set_logger()
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         description="Parse receipt images and output data."
     )
     parser.add_argument(
-        "--receipt-input", nargs="+", required=True, help="Receipt files to parse"
+        "--receipt-input",
+        nargs="+",
+        default=[],
+        help="Receipt files, directories or glob patterns to parse",
+    )
+    parser.add_argument(
+        "--statement-input",
+        nargs="+",
+        default=[],
+        help="Statement files, directories or glob patterns to parse",
+    )
+    parser.add_argument(
+        "--receipt-manifest",
+        action="append",
+        default=[],
+        help="File listing receipt paths, one per line",
     )
     parser.add_argument(
-        "--statement-input", nargs="+", required=True, help="Statement files to parse"
+        "--statement-manifest",
+        action="append",
+        default=[],
+        help="File listing statement paths, one per line",
     )
     parser.add_argument(
         "--receipt-output", required=True, help="Filepath to output JSON receipt data"
@@ -35,34 +50,235 @@ async def _async_main():
         required=False,
         help="List of categories",
     )
+    parser.add_argument(
+        "--fused",
+        action="store_true",
+        help="With --categorize, ask for categories in the same request that transcribes each receipt and statement",
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=OUTPUT_FORMATS,
+        default="json",
+        help="Output as a JSON array or newline delimited JSON (both written as pairs are finalized), or as Parquet or Arrow transactions and receipt items tables",
+    )
+    parser.add_argument(
+        "--incremental",
+        metavar="PREVIOUS_OUTPUT",
+        help="Previous output file, only transactions and receipts not already in it are processed and appended",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read or write the transcription cache, vendor match memo or categorization memo",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore cached transcriptions, matches and categories, updating them with fresh results",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the last unfinished run with the same arguments instead of starting over",
+    )
+    parser.add_argument(
+        "--metrics-output",
+        help="Filepath to write per-stage latency, token and cost metrics as JSON",
+    )
+    parser.add_argument(
+        "--metrics-prometheus",
+        help="Filepath to write the same metrics in Prometheus text format",
+    )
 
-    args = parser.parse_args()
+    return parser
+
+
+async def _async_main(parser: argparse.ArgumentParser, args: argparse.Namespace):
+    # NOTE: imported once the arguments are valid, so --help and usage errors never wait on pydantic/litellm
+    import asyncio
+
+    from .cache import TranscriptionCache
+    from .categorize import (
+        categorize_pairs,
+        remember_fused_categories,
+        set_categories_enum,
+    )
+    from .checkpoint import RunCheckpoint, get_checkpoint_dir
+    from .extract import (
+        iter_merge_statements_receipts,
+        receipts_extract,
+        reextract_invalid,
+        statements_extract,
+    )
+    from .incremental import PreviousRun
+    from .inputs import (
+        SkippedInputs,
+        is_document_mimetype,
+        is_statement_mimetype,
+        iter_file_inputs,
+        iter_input_paths,
+    )
+    from .memo import CategoryMemo, VendorMemo
+    from .pair import assign_pair_ids
+
+    metrics = Metrics.get_metrics()
 
-    receipt_input_filepaths: list[str] = args.receipt_input
-    statement_input_filepaths: list[str] = args.statement_input
+    try:
+        checkpoint = RunCheckpoint(
+            get_checkpoint_dir(args.receipt_output),
+            {name: value for name, value in vars(args).items() if name != "resume"},
+            args.resume,
+        )
+    except ValueError as e:
+        parser.error(str(e))
 
-    receipts = [FileInput(filepath) for filepath in receipt_input_filepaths]
-    receipt_extracts = await receipts_extract(receipts)
+    # NOTE: with --no-cache, work is still recorded in run-scoped stores so --resume has something to pick up
+    if args.no_cache:
+        cache = checkpoint.transcription_cache()
+        memo_path, refresh = checkpoint.memo_path(), False
+    else:
+        cache = TranscriptionCache(
+            refresh=args.refresh, refresh_since=checkpoint.started_at
+        )
+        memo_path, refresh = None, args.refresh
+    vendor_memo = VendorMemo(
+        memo_path, refresh=refresh, refresh_since=checkpoint.started_at
+    )
+
+    previous_run = PreviousRun.load(args.incremental) if args.incremental else None
+
+    categories_enum = set_categories_enum(args.categories) if args.categorize else None
+    category_memo = (
+        CategoryMemo(memo_path, refresh=refresh, refresh_since=checkpoint.started_at)
+        if args.categorize
+        else None
+    )
+
+    checkpointed_pairs = checkpoint.load_pairs() if args.categorize else None
+    if checkpointed_pairs:
+        pairs, pair_ids = checkpointed_pairs
+        logging.info("Resuming categorization of %d checkpointed pairs", len(pairs))
+    else:
+        skipped_receipts, skipped_statements = (
+            SkippedInputs("receipt"),
+            SkippedInputs("statement"),
+        )
+        receipts = iter_file_inputs(
+            iter_input_paths(args.receipt_input, args.receipt_manifest),
+            is_document_mimetype,
+            skipped_receipts,
+        )
+        statements = iter_file_inputs(
+            iter_input_paths(args.statement_input, args.statement_manifest),
+            is_statement_mimetype,
+            skipped_statements,
+        )
+        if previous_run:
+            receipts = previous_run.new_receipt_files(receipts)
+
+        semaphore = asyncio.Semaphore(Config.get_config().extraction_concurrency)
+        fused_categories_enum = categories_enum if args.fused else None
+        receipt_extracts, statement_extracts = await asyncio.gather(
+            metrics.timed(
+                "receipts_extract",
+                receipts_extract(receipts, cache, semaphore, fused_categories_enum),
+            ),
+            metrics.timed(
+                "statements_extract",
+                statements_extract(statements, cache, semaphore, fused_categories_enum),
+            ),
+        )
+        skipped_receipts.report()
+        skipped_statements.report()
+        receipt_extracts, statement_extracts = await metrics.timed(
+            "validate",
+            reextract_invalid(
+                receipt_extracts,
+                statement_extracts,
+                cache,
+                semaphore,
+                fused_categories_enum,
+            ),
+        )
+        if fused_categories_enum is not None and category_memo is not None:
+            remember_fused_categories(
+                receipt_extracts,
+                statement_extracts,
+                fused_categories_enum,
+                category_memo,
+            )
 
-    statements = [FileInput(filepath) for filepath in statement_input_filepaths]
-    statement_extracts = await statements_extract(statements)
+        pair_ids = assign_pair_ids(statement_extracts)
+        if previous_run:
+            statement_extracts, pair_ids = previous_run.new_transactions(
+                statement_extracts, pair_ids
+            )
 
-    # merge
-    pairs = await merge_statements_receipts(statement_extracts, receipt_extracts)
+        # merge
+        pair_stream = iter_merge_statements_receipts(
+            statement_extracts, receipt_extracts, vendor_memo
+        )
+        if args.categorize:
+            with metrics.stage("merge_statements_receipts"):
+                pairs = [pair async for pair in pair_stream]
+            checkpoint.save_pairs(pairs, pair_ids)
 
-    if args.categorize:
-        pairs = await categorize_pairs(pairs, set_categories_enum(args.categories))
+    if categories_enum is not None and category_memo is not None:
+        with metrics.stage("categorize_pairs"):
+            categorized_pairs = await categorize_pairs(
+                pairs, categories_enum, category_memo
+            )
+        category_memo.close()
 
-    pairs_json = [json.loads(pair.model_dump_json()) for pair in pairs]
-    for pair_json in pairs_json:
-        pair_json["id"] = str(uuid.uuid4())
+    writer = open_output_writer(args.output_format, args.receipt_output)
+    try:
+        if previous_run:
+            for previous_pair in previous_run.pairs:
+                writer.write(previous_pair)
 
-    with open(args.receipt_output, "w") as f:
-        json.dump(pairs_json, f, indent=4)
+        if args.categorize:
+            for categorized_pair, pair_id in zip(categorized_pairs, pair_ids):
+                writer.write(pair_to_json(categorized_pair, pair_id))
+        else:
+            pair_ids_iter = iter(pair_ids)
+            with metrics.stage("merge_statements_receipts"):
+                async for pair in pair_stream:
+                    writer.write(pair_to_json(pair, next(pair_ids_iter)))
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+
+    vendor_memo.close()
+    checkpoint.complete()
+
+    if args.metrics_output:
+        metrics.write_json(args.metrics_output)
+    if args.metrics_prometheus:
+        metrics.write_prometheus(args.metrics_prometheus)
 
 
 def main():
-    asyncio.run(_async_main())
+    set_logger()
+    parser = build_parser()
+    args = parser.parse_args()
+    if not args.receipt_input and not args.receipt_manifest:
+        parser.error("one of --receipt-input or --receipt-manifest is required")
+    if not args.statement_input and not args.statement_manifest:
+        parser.error("one of --statement-input or --statement-manifest is required")
+    if args.fused and not args.categorize:
+        parser.error("--fused requires --categorize")
+    if (
+        args.output_format in COLUMNAR_FORMATS
+        and importlib.util.find_spec("pyarrow") is None
+    ):
+        parser.error(
+            f"--output-format {args.output_format} requires the arrow extra (pyarrow)"
+        )
+
+    import asyncio
+
+    asyncio.run(_async_main(parser, args))
 
 
 if __name__ == "__main__":
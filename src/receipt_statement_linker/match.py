@@ -0,0 +1,421 @@
+import asyncio
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+import logging
+import math
+import textwrap
+from typing import Callable
+
+from pydantic import BaseModel
+
+from .config import Config
+from .llm import structured_completion
+from .receipt import TranscribedReceipt
+from .statement import Transaction, to_cents
+
+
+def to_timestamp(value: datetime) -> float:
+    # NOTE: models sometimes drop the timezone, treat naive datetimes as UTC so they compare with aware ones
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class ReceiptIndex:
+    def __init__(
+        self,
+        receipts: list[TranscribedReceipt],
+        date_window: timedelta | None = None,
+    ):
+        self._receipts = receipts
+        self._date_window = date_window
+        self._consumed = [False] * len(receipts)
+
+        self._cents = [to_cents(receipt.grand_total) for receipt in receipts]
+        self._timestamps = [to_timestamp(receipt.datetime) for receipt in receipts]
+
+        # cents -> [(timestamp, receipt index)] sorted by timestamp
+        self._buckets: dict[int, list[tuple[float, int]]] = defaultdict(list)
+        for i, (cents, timestamp) in enumerate(zip(self._cents, self._timestamps)):
+            self._buckets[cents].append((timestamp, i))
+        for bucket in self._buckets.values():
+            bucket.sort()
+        self._consumed_per_bucket: dict[int, int] = defaultdict(int)
+
+        # (cents, receipt index) and (timestamp, receipt index), both sorted, for range lookups
+        self._by_cents: list[tuple[int, int]] | None = None
+        self._by_time: list[tuple[float, int]] | None = None
+        self._consumed_since_sort = 0
+
+    def __getitem__(self, i: int) -> TranscribedReceipt:
+        return self._receipts[i]
+
+    def candidates(self, amount: float, when: datetime) -> list[int]:
+        bucket = self._buckets.get(to_cents(amount))
+        if not bucket:
+            return []
+
+        if self._date_window is None:
+            lo, hi = 0, len(bucket)
+        else:
+            timestamp = to_timestamp(when)
+            window = self._date_window.total_seconds()
+            lo = bisect_left(bucket, (timestamp - window, -1))
+            hi = bisect_right(bucket, (timestamp + window, math.inf))
+
+        # NOTE: keep candidates in input order so ties resolve the same way as before indexing
+        return sorted(i for _, i in bucket[lo:hi] if not self._consumed[i])
+
+    def candidates_between(
+        self, low_amount: float, high_amount: float, when: datetime
+    ) -> list[int]:
+        low_cents, high_cents = to_cents(low_amount), to_cents(high_amount)
+        if self._by_cents is None or self._by_time is None:
+            remaining = [i for i, consumed in enumerate(self._consumed) if not consumed]
+            self._by_cents = sorted((self._cents[i], i) for i in remaining)
+            self._by_time = sorted((self._timestamps[i], i) for i in remaining)
+            self._consumed_since_sort = 0
+        lo = bisect_left(self._by_cents, (low_cents, -1))
+        hi = bisect_right(self._by_cents, (high_cents, math.inf))
+        if self._date_window is None:
+            return sorted(i for _, i in self._by_cents[lo:hi] if not self._consumed[i])
+
+        timestamp = to_timestamp(when)
+        window = self._date_window.total_seconds()
+        time_lo = bisect_left(self._by_time, (timestamp - window, -1))
+        time_hi = bisect_right(self._by_time, (timestamp + window, math.inf))
+        # NOTE: walk whichever of the two ranges is shorter and filter it on the other
+        if time_hi - time_lo < hi - lo:
+            return sorted(
+                i
+                for _, i in self._by_time[time_lo:time_hi]
+                if low_cents <= self._cents[i] <= high_cents and not self._consumed[i]
+            )
+        return sorted(
+            i
+            for _, i in self._by_cents[lo:hi]
+            if abs(self._timestamps[i] - timestamp) <= window and not self._consumed[i]
+        )
+
+    def consume(self, i: int):
+        if self._consumed[i]:
+            return
+        self._consumed[i] = True
+
+        cents = self._cents[i]
+        self._consumed_per_bucket[cents] += 1
+        bucket = self._buckets[cents]
+        # NOTE: compact once half the bucket is consumed so lookups don't keep skipping dead entries
+        if self._consumed_per_bucket[cents] * 2 > len(bucket):
+            bucket[:] = [entry for entry in bucket if not self._consumed[entry[1]]]
+            self._consumed_per_bucket[cents] = 0
+
+        if self._by_cents is not None:
+            self._consumed_since_sort += 1
+            if self._consumed_since_sort * 2 > len(self._by_cents):
+                self._by_cents = self._by_time = None
+
+
+def amount_score(
+    transaction_amount: float,
+    receipt_total: float,
+    rounding_tolerance: float,
+    tip_tolerance: float,
+) -> float:
+    # NOTE: exact totals score 1, a few cents of rounding or currency conversion a little less,
+    # and a charge above the receipt total (a tip added after printing) less the bigger the tip
+    difference = to_cents(transaction_amount) - to_cents(receipt_total)
+    tolerance_cents = to_cents(rounding_tolerance)
+    if difference == 0:
+        return 1.0
+    if abs(difference) <= tolerance_cents:
+        return 1.0 - 0.1 * abs(difference) / tolerance_cents
+    if difference > 0 and receipt_total > 0:
+        tip_ratio = difference / to_cents(receipt_total)
+        if tip_ratio <= tip_tolerance:
+            return 0.7 - 0.4 * tip_ratio / tip_tolerance
+    return 0.0
+
+
+def date_score(
+    transaction_when: datetime, receipt_when: datetime, scale_days: float
+) -> float:
+    days_apart = (
+        abs(to_timestamp(transaction_when) - to_timestamp(receipt_when)) / 86400
+    )
+    return max(0.0, 1.0 - days_apart / scale_days)
+
+
+AMOUNT_WEIGHT, DATE_WEIGHT, VENDOR_WEIGHT = 0.5, 0.2, 0.3
+SCORED_DATE_WINDOW_DAYS = 14
+
+
+def match_date_window() -> timedelta | None:
+    # NOTE: scored matching always gets a window, otherwise every transaction scans a whole tip range of receipts
+    config = Config.get_config()
+    days = config.match_date_window_days
+    if days is None and config.matching_strategy == "scored":
+        days = SCORED_DATE_WINDOW_DAYS
+    return timedelta(days=days) if days is not None else None
+
+
+def scored_match(
+    transactions: list[Transaction],
+    receipt_index: ReceiptIndex,
+    vendor_score: Callable[[str, str], float],
+) -> dict[int, int]:
+    config = Config.get_config()
+    scale_days = float(config.match_date_window_days or SCORED_DATE_WINDOW_DAYS)
+    tolerance = config.match_amount_tolerance
+
+    def match_range(
+        transaction_ids: list[int],
+        amount_range: Callable[[float], tuple[float, float]],
+        vendor_backs_inexact: Callable[[float], bool],
+    ) -> dict[int, int]:
+        scores: dict[tuple[int, int], float] = {}
+        for transaction_i in transaction_ids:
+            transaction = transactions[transaction_i]
+            amount = transaction.withdrawl_amount
+            assert amount is not None
+            for receipt_i in receipt_index.candidates_between(
+                *amount_range(amount), transaction.datetime
+            ):
+                receipt = receipt_index[receipt_i]
+                amount_points = amount_score(
+                    amount, receipt.grand_total, tolerance, config.match_tip_tolerance
+                )
+                if amount_points == 0:
+                    continue
+                vendor_points = vendor_score(receipt.vendor, transaction.name)
+                # NOTE: an inexact amount and a close date reach match_min_score on their own,
+                # so the vendor has to back them up
+                if amount_points < 1 and not vendor_backs_inexact(vendor_points):
+                    continue
+                score = (
+                    AMOUNT_WEIGHT * amount_points
+                    + DATE_WEIGHT
+                    * date_score(transaction.datetime, receipt.datetime, scale_days)
+                    + VENDOR_WEIGHT * vendor_points
+                )
+                if score >= config.match_min_score:
+                    scores[(transaction_i, receipt_i)] = score
+
+        matching = max_score_matching(scores)
+        for receipt_i in matching.values():
+            receipt_index.consume(receipt_i)
+        return matching
+
+    # NOTE: exact totals give or take rounding are matched first, and only the transactions left over
+    # look for a tip among the receipts left over, so the wide tip range is rarely scanned
+    withdrawals = [
+        transaction_i
+        for transaction_i, transaction in enumerate(transactions)
+        if transaction.withdrawl_amount is not None
+    ]
+    matching = match_range(
+        withdrawals,
+        lambda amount: (amount - tolerance, amount + tolerance),
+        lambda vendor_points: vendor_points > config.vendor_mismatch_threshold,
+    )
+    matching.update(
+        match_range(
+            [i for i in withdrawals if i not in matching],
+            lambda amount: (
+                amount / (1 + config.match_tip_tolerance) - tolerance,
+                amount - tolerance,
+            ),
+            lambda vendor_points: vendor_points >= config.vendor_match_threshold,
+        )
+    )
+    return matching
+
+
+class VendorMatch(BaseModel):
+    index: int
+    matching_candidates: list[int]
+
+
+class VendorMatches(BaseModel):
+    matches: list[VendorMatch]
+
+
+VENDOR_MATCH_SYSTEM_PROMPT = textwrap.dedent(
+    """
+    You are an accurate receipt vendor to statement transaction name matcher. You will be provided indexed bank statement transaction names, each with a numbered list of candidate vendor names from receipts. For each index, determine which candidates refer to the same vendor/merchant as the transaction name, and output their numbers based on the schema provided. If no candidate matches, output an empty list for that index.
+    """
+).strip()
+
+
+def get_vendor_match_user_message(
+    groups: list[tuple[Transaction, list[TranscribedReceipt]]],
+) -> str:
+    return "\n\n".join(
+        f"<index>\n{i}\n</index>\n<statement_transaction_name>\n{transaction.name}\n</statement_transaction_name>\n<receipt_vendors>\n"
+        + "\n".join(
+            f"{j}. {receipt.vendor}" for j, receipt in enumerate(receipts, start=1)
+        )
+        + "\n</receipt_vendors>"
+        for i, (transaction, receipts) in enumerate(groups, start=1)
+    )
+
+
+async def _vendor_match_batch(
+    groups: list[tuple[Transaction, list[TranscribedReceipt]]],
+) -> list[set[int]]:
+    messages: list[dict] = [
+        {"content": VENDOR_MATCH_SYSTEM_PROMPT, "role": "system"},
+        {"role": "user", "content": get_vendor_match_user_message(groups)},
+    ]
+    vendor_matches = await structured_completion(
+        Config.get_config().matching_model, messages, VendorMatches
+    )
+
+    matches: list[set[int]] = [set() for _ in groups]
+    for vendor_match in vendor_matches.matches:
+        if not 1 <= vendor_match.index <= len(groups):
+            logging.warning(
+                "Vendor match returned unknown index %d", vendor_match.index
+            )
+            continue
+        _, receipts = groups[vendor_match.index - 1]
+        matches[vendor_match.index - 1] = {
+            candidate - 1
+            for candidate in vendor_match.matching_candidates
+            if 1 <= candidate <= len(receipts)
+        }
+    return matches
+
+
+async def batch_vendor_match(
+    groups: list[tuple[Transaction, list[TranscribedReceipt]]],
+) -> list[set[int]]:
+    # NOTE: returns, per group, the positions of the candidate receipts whose vendor matches the transaction
+    batch_size = max(Config.get_config().matching_batch_size, 1)
+    batches = [groups[i : i + batch_size] for i in range(0, len(groups), batch_size)]
+    batch_matches = await asyncio.gather(
+        *(_vendor_match_batch(batch) for batch in batches)
+    )
+    return [matches for batch in batch_matches for matches in batch]
+
+
+MAX_ASSIGNMENT_SIZE = 300
+
+
+def min_cost_assignment(costs: list[list[float]]) -> list[int]:
+    # NOTE: Hungarian method with potentials, O(rows^2 * columns), needs rows <= columns
+    rows, columns = len(costs), len(costs[0]) if costs else 0
+    row_potential, column_potential = [0.0] * (rows + 1), [0.0] * (columns + 1)
+    # column -> row assigned to it, 1-based with 0 meaning free
+    column_row = [0] * (columns + 1)
+    for row in range(1, rows + 1):
+        column_row[0] = row
+        free_column = 0
+        min_slack = [math.inf] * (columns + 1)
+        previous_column = [0] * (columns + 1)
+        visited = [False] * (columns + 1)
+        while column_row[free_column] != 0:
+            visited[free_column] = True
+            current_row, delta, next_column = column_row[free_column], math.inf, 0
+            for column in range(1, columns + 1):
+                if visited[column]:
+                    continue
+                slack = (
+                    costs[current_row - 1][column - 1]
+                    - row_potential[current_row]
+                    - column_potential[column]
+                )
+                if slack < min_slack[column]:
+                    min_slack[column], previous_column[column] = slack, free_column
+                if min_slack[column] < delta:
+                    delta, next_column = min_slack[column], column
+            for column in range(columns + 1):
+                if visited[column]:
+                    row_potential[column_row[column]] += delta
+                    column_potential[column] -= delta
+                else:
+                    min_slack[column] -= delta
+            free_column = next_column
+        while free_column:
+            column_row[free_column] = column_row[previous_column[free_column]]
+            free_column = previous_column[free_column]
+
+    assignment = [-1] * rows
+    for column in range(1, columns + 1):
+        if column_row[column]:
+            assignment[column_row[column] - 1] = column - 1
+    return assignment
+
+
+def max_score_matching(
+    scores: dict[tuple[int, int], float],
+) -> dict[int, int]:
+    # NOTE: (transaction, receipt) -> score in, transaction -> receipt out, maximizing the total score.
+    # candidate edges are split into connected components first, so the cubic assignment only ever sees
+    # the handful of transactions that actually compete for the same receipts
+    parent: dict[tuple[str, int], tuple[str, int]] = {}
+
+    def find(node: tuple[str, int]) -> tuple[str, int]:
+        parent.setdefault(node, node)
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for transaction_i, receipt_i in scores:
+        parent[find(("t", transaction_i))] = find(("r", receipt_i))
+
+    components: dict[tuple[str, int], list[tuple[int, int]]] = defaultdict(list)
+    for edge in scores:
+        components[find(("t", edge[0]))].append(edge)
+
+    matching: dict[int, int] = {}
+    for edges in components.values():
+        transaction_ids = sorted({transaction_i for transaction_i, _ in edges})
+        receipt_ids = sorted({receipt_i for _, receipt_i in edges})
+        if len(edges) == 1:
+            [(transaction_i, receipt_i)] = edges
+            matching[transaction_i] = receipt_i
+            continue
+        if min(len(transaction_ids), len(receipt_ids)) > MAX_ASSIGNMENT_SIZE:
+            # NOTE: e.g. a year of identical subscription charges, best score first is close enough there
+            taken: set[int] = set()
+            for transaction_i, receipt_i in sorted(
+                edges, key=lambda edge: (-scores[edge], edge)
+            ):
+                if transaction_i not in matching and receipt_i not in taken:
+                    matching[transaction_i] = receipt_i
+                    taken.add(receipt_i)
+            continue
+
+        transposed = len(transaction_ids) > len(receipt_ids)
+        row_ids, column_ids = (
+            (receipt_ids, transaction_ids)
+            if transposed
+            else (transaction_ids, receipt_ids)
+        )
+        # NOTE: missing edges cost 0 like leaving the row unmatched, real edges are negative
+        # so any assignment through a missing edge is dropped below without losing optimality
+        costs = [[0.0] * len(column_ids) for _ in row_ids]
+        row_positions = {row_id: i for i, row_id in enumerate(row_ids)}
+        column_positions = {column_id: i for i, column_id in enumerate(column_ids)}
+        for transaction_i, receipt_i in edges:
+            row_id, column_id = (
+                (receipt_i, transaction_i) if transposed else (transaction_i, receipt_i)
+            )
+            costs[row_positions[row_id]][column_positions[column_id]] = -scores[
+                (transaction_i, receipt_i)
+            ]
+
+        for row, column in enumerate(min_cost_assignment(costs)):
+            if column < 0:
+                continue
+            transaction_i, receipt_i = (
+                (column_ids[column], row_ids[row])
+                if transposed
+                else (row_ids[row], column_ids[column])
+            )
+            if (transaction_i, receipt_i) in scores:
+                matching[transaction_i] = receipt_i
+    return matching
@@ -0,0 +1,262 @@
+import argparse
+import hashlib
+import json
+import logging
+from pathlib import Path
+import sqlite3
+import time
+
+from .config import Config, get_app_dir
+from .metrics import Metrics
+from .vendor import normalize_vendor
+
+
+def get_memo_path() -> Path:
+    return (
+        get_app_dir("XDG_DATA_HOME", Path.home() / ".local" / "share") / "memo.sqlite3"
+    )
+
+
+def connect_memo(db_path: Path | None = None) -> sqlite3.Connection:
+    connection = sqlite3.connect(db_path or get_memo_path())
+    connection.execute("PRAGMA journal_mode=WAL")
+    return connection
+
+
+class _Memo:
+    def __init__(
+        self, db_path: Path | None, refresh: bool, refresh_since: float | None
+    ):
+        self._connection = connect_memo(db_path)
+        self._refreshed_after = (refresh_since or time.time()) if refresh else 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        logging.info(
+            "%s hits=%d misses=%d", type(self).__name__, self.hits, self.misses
+        )
+        metrics = Metrics.get_metrics()
+        metrics.increment(f"{type(self).__name__}_hits", self.hits)
+        metrics.increment(f"{type(self).__name__}_misses", self.misses)
+        self._connection.close()
+
+
+class VendorMemo(_Memo):
+    def __init__(
+        self,
+        db_path: Path | None = None,
+        ttl_days: int | None = None,
+        max_entries: int | None = None,
+        refresh: bool = False,
+        refresh_since: float | None = None,
+    ):
+        super().__init__(db_path, refresh, refresh_since)
+        config = Config.get_config()
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS vendor_matches (
+                vendor_key TEXT NOT NULL,
+                name_key TEXT NOT NULL,
+                is_match INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (vendor_key, name_key)
+            )
+            """
+        )
+        self._ttl_days = (
+            ttl_days if ttl_days is not None else config.vendor_memo_ttl_days
+        )
+        self._max_entries = (
+            max_entries if max_entries is not None else config.vendor_memo_max_entries
+        )
+
+    @staticmethod
+    def key(vendor: str, transaction_name: str) -> tuple[str, str]:
+        # NOTE: normalized so "WALMART #1234" and "WALMART #5678" share one decision
+        return normalize_vendor(vendor), normalize_vendor(transaction_name)
+
+    def _oldest_valid(self) -> float:
+        if self._ttl_days is None:
+            return 0.0
+        return time.time() - self._ttl_days * 24 * 60 * 60
+
+    def _oldest_readable(self) -> float:
+        return max(self._oldest_valid(), self._refreshed_after)
+
+    def get(self, vendor: str, transaction_name: str) -> bool | None:
+        vendor_key, name_key = self.key(vendor, transaction_name)
+        if not vendor_key or not name_key:
+            return None
+
+        row = self._connection.execute(
+            "SELECT is_match FROM vendor_matches WHERE vendor_key = ? AND name_key = ? AND updated_at >= ?",
+            (vendor_key, name_key, self._oldest_readable()),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return bool(row[0])
+
+    def set_many(self, decisions: list[tuple[str, str, bool]]):
+        now = time.time()
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO vendor_matches VALUES (?, ?, ?, ?)",
+                [
+                    (vendor_key, name_key, int(is_match), now)
+                    for vendor, transaction_name, is_match in decisions
+                    for vendor_key, name_key in [self.key(vendor, transaction_name)]
+                    if vendor_key and name_key
+                ],
+            )
+        self.evict()
+
+    def evict(self):
+        with self._connection:
+            self._connection.execute(
+                "DELETE FROM vendor_matches WHERE updated_at < ?",
+                (self._oldest_valid(),),
+            )
+            self._connection.execute(
+                """
+                DELETE FROM vendor_matches WHERE rowid NOT IN (
+                    SELECT rowid FROM vendor_matches ORDER BY updated_at DESC, rowid DESC LIMIT ?
+                )
+                """,
+                (self._max_entries,),
+            )
+
+    def export_json(self, path: str):
+        rows = self._connection.execute(
+            "SELECT vendor_key, name_key, is_match, updated_at FROM vendor_matches"
+        ).fetchall()
+        with open(path, "w") as f:
+            json.dump(
+                [
+                    {
+                        "vendor": vendor_key,
+                        "transaction_name": name_key,
+                        "is_match": bool(is_match),
+                        "updated_at": updated_at,
+                    }
+                    for vendor_key, name_key, is_match, updated_at in rows
+                ],
+                f,
+                indent=4,
+            )
+
+    def import_json(self, path: str) -> int:
+        with open(path) as f:
+            entries = json.load(f)
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO vendor_matches VALUES (?, ?, ?, ?)",
+                [
+                    (
+                        *self.key(entry["vendor"], entry["transaction_name"]),
+                        int(entry["is_match"]),
+                        entry.get("updated_at", time.time()),
+                    )
+                    for entry in entries
+                ],
+            )
+        self.evict()
+        return len(entries)
+
+
+class CategoryMemo(_Memo):
+    def __init__(
+        self,
+        db_path: Path | None = None,
+        max_entries: int | None = None,
+        refresh: bool = False,
+        refresh_since: float | None = None,
+    ):
+        super().__init__(db_path, refresh, refresh_since)
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS categories (
+                key TEXT PRIMARY KEY,
+                category TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._max_entries = (
+            max_entries
+            if max_entries is not None
+            else Config.get_config().category_memo_max_entries
+        )
+
+    @staticmethod
+    def key(*parts: str | None) -> str:
+        return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+    def get_many(self, keys: list[str]) -> list[str | None]:
+        if not keys:
+            return []
+
+        found: dict[str, str] = {}
+        # NOTE: stay under sqlite's bound parameter limit
+        for i in range(0, len(keys), 500):
+            keys_chunk = keys[i : i + 500]
+            found.update(
+                self._connection.execute(
+                    f"SELECT key, category FROM categories WHERE key IN ({', '.join('?' * len(keys_chunk))}) AND updated_at >= ?",
+                    [*keys_chunk, self._refreshed_after],
+                ).fetchall()
+            )
+
+        categories = [found.get(key) for key in keys]
+        self.hits += sum(category is not None for category in categories)
+        self.misses += sum(category is None for category in categories)
+        return categories
+
+    def set_many(self, entries: list[tuple[str, str]]):
+        if not entries:
+            return
+
+        now = time.time()
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO categories VALUES (?, ?, ?)",
+                [(key, category, now) for key, category in entries],
+            )
+            self._connection.execute(
+                """
+                DELETE FROM categories WHERE rowid NOT IN (
+                    SELECT rowid FROM categories ORDER BY updated_at DESC, rowid DESC LIMIT ?
+                )
+                """,
+                (self._max_entries,),
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Manage the vendor match memo used when linking receipts."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Export memo to JSON")
+    export_parser.add_argument("path")
+    import_parser = subparsers.add_parser("import", help="Import memo from JSON")
+    import_parser.add_argument("path")
+    subparsers.add_parser("prune", help="Drop expired entries and enforce max size")
+
+    args = parser.parse_args()
+
+    vendor_memo = VendorMemo()
+    if args.command == "export":
+        vendor_memo.export_json(args.path)
+    elif args.command == "import":
+        print(f"Imported {vendor_memo.import_json(args.path)} entries")
+    else:
+        vendor_memo.evict()
+    vendor_memo.close()
+
+
+if __name__ == "__main__":
+    main()
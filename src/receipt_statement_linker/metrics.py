@@ -0,0 +1,253 @@
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime
+import json
+import logging
+import time
+from typing import Any, Awaitable, Iterator, TypeVar
+
+from .config import Config
+
+_METRICS: "Metrics | None" = None
+_CALLBACK_INSTALLED = False
+
+_CURRENT_STAGE: ContextVar[str] = ContextVar("current_stage", default="unknown")
+
+A = TypeVar("A")
+
+
+@dataclass
+class CompletionRecord:
+    stage: str
+    model: str
+    wall_seconds: float
+    input_tokens: int
+    output_tokens: int
+    cost: float
+    success: bool
+    retries: int = 0
+
+
+def _percentile(values: list[float], percentile: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(percentile / 100 * len(ordered)))]
+
+
+def _get_tracer() -> Any:
+    if not Config.get_config().opentelemetry:
+        return None
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        logging.warning("opentelemetry is not installed, spans will not be emitted")
+        return None
+    return trace.get_tracer("receipt_statement_linker")
+
+
+class Metrics:
+    def __init__(self):
+        self.stages: dict[str, float] = {}
+        self.completions: list[CompletionRecord] = []
+        self.queue_waits: defaultdict[str, list[float]] = defaultdict(list)
+        self.counters: Counter[str] = Counter()
+        self._tracer = _get_tracer()
+
+    @classmethod
+    def get_metrics(cls) -> "Metrics":
+        global _METRICS
+        if not _METRICS:
+            _METRICS = cls()
+        return _METRICS
+
+    @staticmethod
+    def current_stage() -> str:
+        return _CURRENT_STAGE.get()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        token = _CURRENT_STAGE.set(name)
+        span = self._tracer.start_span(name) if self._tracer else None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+            if span:
+                span.end()
+            _CURRENT_STAGE.reset(token)
+
+    async def timed(self, name: str, awaitable: Awaitable[A]) -> A:
+        with self.stage(name):
+            return await awaitable
+
+    def record_queue_wait(self, seconds: float):
+        self.queue_waits[self.current_stage()].append(seconds)
+
+    def increment(self, name: str, value: int = 1):
+        self.counters[name] += value
+
+    def record_completion(
+        self, record: CompletionRecord, start_time: datetime, end_time: datetime
+    ):
+        self.completions.append(record)
+        if self._tracer:
+            span = self._tracer.start_span(
+                "litellm.acompletion",
+                start_time=int(start_time.timestamp() * 1e9),
+                attributes={
+                    "stage": record.stage,
+                    "model": record.model,
+                    "input_tokens": record.input_tokens,
+                    "output_tokens": record.output_tokens,
+                    "cost": record.cost,
+                    "success": record.success,
+                },
+            )
+            span.end(end_time=int(end_time.timestamp() * 1e9))
+
+    def summary(self) -> dict[str, Any]:
+        completions_by_key: defaultdict[tuple[str, str], list[CompletionRecord]] = (
+            defaultdict(list)
+        )
+        for record in self.completions:
+            completions_by_key[(record.stage, record.model)].append(record)
+
+        return {
+            "stages": {
+                name: {"wall_seconds": wall_seconds}
+                for name, wall_seconds in self.stages.items()
+            },
+            "completions": [
+                {
+                    "stage": stage,
+                    "model": model,
+                    "requests": len(records),
+                    "failures": sum(not record.success for record in records),
+                    "retries": sum(record.retries for record in records),
+                    "input_tokens": sum(record.input_tokens for record in records),
+                    "output_tokens": sum(record.output_tokens for record in records),
+                    "cost": sum(record.cost for record in records),
+                    "wall_seconds_p50": _percentile(
+                        [record.wall_seconds for record in records], 50
+                    ),
+                    "wall_seconds_p95": _percentile(
+                        [record.wall_seconds for record in records], 95
+                    ),
+                    "wall_seconds_max": max(record.wall_seconds for record in records),
+                }
+                for (stage, model), records in completions_by_key.items()
+            ],
+            "queue_wait": {
+                stage: {
+                    "count": len(waits),
+                    "total_seconds": sum(waits),
+                    "p95_seconds": _percentile(waits, 95),
+                }
+                for stage, waits in self.queue_waits.items()
+            },
+            "counters": dict(self.counters),
+        }
+
+    def write_json(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=4)
+
+    def prometheus_text(self) -> str:
+        prefix = "receipt_statement_linker"
+        lines = [f"# TYPE {prefix}_stage_seconds gauge"]
+        lines += [
+            f'{prefix}_stage_seconds{{stage="{name}"}} {wall_seconds}'
+            for name, wall_seconds in self.stages.items()
+        ]
+
+        completion_metrics = {
+            "llm_requests_total": lambda record: 1,
+            "llm_failures_total": lambda record: int(not record.success),
+            "llm_retries_total": lambda record: record.retries,
+            "llm_input_tokens_total": lambda record: record.input_tokens,
+            "llm_output_tokens_total": lambda record: record.output_tokens,
+            "llm_cost_total": lambda record: record.cost,
+            "llm_request_seconds_sum": lambda record: record.wall_seconds,
+        }
+        for metric_name, value in completion_metrics.items():
+            totals: defaultdict[tuple[str, str], float] = defaultdict(float)
+            for record in self.completions:
+                totals[(record.stage, record.model)] += value(record)
+            lines.append(f"# TYPE {prefix}_{metric_name} counter")
+            lines += [
+                f'{prefix}_{metric_name}{{stage="{stage}",model="{model}"}} {total}'
+                for (stage, model), total in totals.items()
+            ]
+
+        lines.append(f"# TYPE {prefix}_queue_wait_seconds_sum counter")
+        lines += [
+            f'{prefix}_queue_wait_seconds_sum{{stage="{stage}"}} {sum(waits)}'
+            for stage, waits in self.queue_waits.items()
+        ]
+        lines.append(f"# TYPE {prefix}_events_total counter")
+        lines += [
+            f'{prefix}_events_total{{name="{name}"}} {value}'
+            for name, value in self.counters.items()
+        ]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        with open(path, "w") as f:
+            f.write(self.prometheus_text())
+
+
+def _completion_record(
+    kwargs: dict[str, Any],
+    response_obj: Any,
+    start_time: datetime,
+    end_time: datetime,
+    success: bool,
+) -> CompletionRecord:
+    usage = getattr(response_obj, "usage", None)
+    metadata = (kwargs.get("litellm_params") or {}).get("metadata") or {}
+    return CompletionRecord(
+        stage=Metrics.current_stage(),
+        model=str(kwargs.get("model", "unknown")),
+        wall_seconds=(end_time - start_time).total_seconds(),
+        input_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+        output_tokens=getattr(usage, "completion_tokens", 0) or 0,
+        cost=kwargs.get("response_cost") or 0.0,
+        success=success,
+        # NOTE: the llm client tags each request with its attempt number, anything past the first is a retry
+        retries=int(metadata.get("attempt", 0) > 0),
+    )
+
+
+def install_litellm_callback():
+    import litellm
+    from litellm.integrations.custom_logger import CustomLogger
+
+    metrics = Metrics.get_metrics()
+
+    class MetricsLogger(CustomLogger):
+        async def async_log_success_event(
+            self, kwargs, response_obj, start_time, end_time
+        ):
+            metrics.record_completion(
+                _completion_record(kwargs, response_obj, start_time, end_time, True),
+                start_time,
+                end_time,
+            )
+
+        async def async_log_failure_event(
+            self, kwargs, response_obj, start_time, end_time
+        ):
+            metrics.record_completion(
+                _completion_record(kwargs, response_obj, start_time, end_time, False),
+                start_time,
+                end_time,
+            )
+
+    global _CALLBACK_INSTALLED
+    if not _CALLBACK_INSTALLED:
+        litellm.callbacks.append(MetricsLogger())
+        _CALLBACK_INSTALLED = True
@@ -0,0 +1,113 @@
+import json
+import os
+from pathlib import Path
+import textwrap
+from typing import TYPE_CHECKING, Any, Protocol
+
+from .columnar import COLUMNAR_FORMATS, is_columnar_file
+
+if TYPE_CHECKING:
+    from pydantic import BaseModel
+
+
+def pair_to_json(pair: "BaseModel", pair_id: str) -> dict[str, Any]:
+    pair_json = pair.model_dump(mode="json")
+    pair_json["id"] = pair_id
+    return pair_json
+
+
+def load_pairs(path: str) -> list[dict[str, Any]]:
+    if is_columnar_file(path):
+        from .columnar import load_columnar_pairs
+
+        return load_columnar_pairs(path)
+    with open(path) as f:
+        content = f.read()
+    if content.lstrip().startswith("["):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+def temp_output_path(path: str | Path) -> Path:
+    # NOTE: same directory as the target so the final os.replace is an atomic rename
+    target = Path(path)
+    return target.with_name(f".{target.name}.{os.getpid()}.tmp")
+
+
+class AtomicOutputFile:
+    # NOTE: a run that fails part way (e.g. --incremental writing over its own input) keeps the previous output
+    def __init__(self, path: str):
+        self._path = path
+        self._tmp_path = temp_output_path(path)
+        self.f = open(self._tmp_path, "w")
+
+    def commit(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+        os.replace(self._tmp_path, self._path)
+
+    def abort(self):
+        self.f.close()
+        self._tmp_path.unlink(missing_ok=True)
+
+
+class JsonArrayWriter:
+    # NOTE: writes the same layout as json.dump(..., indent=4) one element at a time
+    def __init__(self, path: str):
+        self._file = AtomicOutputFile(path)
+        self._f = self._file.f
+        self._count = 0
+        self._f.write("[")
+
+    def write(self, pair_json: dict[str, Any]):
+        self._f.write(",\n" if self._count else "\n")
+        self._f.write(textwrap.indent(json.dumps(pair_json, indent=4), "    "))
+        self._count += 1
+
+    def close(self):
+        self._f.write("\n]" if self._count else "]")
+        self._file.commit()
+
+    def abort(self):
+        self._file.abort()
+
+
+class NdjsonWriter:
+    def __init__(self, path: str):
+        self._file = AtomicOutputFile(path)
+        self._f = self._file.f
+
+    def write(self, pair_json: dict[str, Any]):
+        self._f.write(json.dumps(pair_json))
+        self._f.write("\n")
+        self._f.flush()
+
+    def close(self):
+        self._file.commit()
+
+    def abort(self):
+        self._file.abort()
+
+
+OUTPUT_WRITERS: dict[str, type[JsonArrayWriter] | type[NdjsonWriter]] = {
+    "json": JsonArrayWriter,
+    "ndjson": NdjsonWriter,
+}
+OUTPUT_FORMATS = sorted([*OUTPUT_WRITERS, *COLUMNAR_FORMATS])
+
+
+class OutputWriter(Protocol):
+    def write(self, pair_json: dict[str, Any]): ...
+
+    def close(self): ...
+
+    def abort(self): ...
+
+
+def open_output_writer(output_format: str, path: str) -> OutputWriter:
+    if output_format in COLUMNAR_FORMATS:
+        from .columnar import ColumnarWriter
+
+        return ColumnarWriter(path, output_format)
+    return OUTPUT_WRITERS[output_format](path)
@@ -1,9 +1,38 @@
 from __future__ import annotations
+from collections import Counter
+import json
+from typing import Any
+import uuid
+
 from pydantic import BaseModel
 
 from .receipt import TranscribedReceipt
 
-from .statement import Transaction
+from .statement import Transaction, TranscribedStatements
+
+PAIR_ID_NAMESPACE = uuid.UUID("6f3b0d7e-4c1a-5e8b-9a2d-1f4e7c3b8a90")
+
+
+def transaction_content_key(transaction_json: dict[str, Any]) -> str:
+    # NOTE: only Transaction fields, so categorized output (which adds "category") hashes the same
+    return json.dumps(
+        {field: transaction_json.get(field) for field in Transaction.model_fields},
+        sort_keys=True,
+    )
+
+
+def assign_pair_ids(statements: TranscribedStatements) -> list[str]:
+    # NOTE: identical transactions (two coffees on the same day) are told apart by occurrence order
+    occurrences: Counter[str] = Counter()
+    pair_ids: list[str] = []
+    for statement in statements.transcribed_statements:
+        for transaction in statement.transactions:
+            key = transaction_content_key(transaction.model_dump(mode="json"))
+            pair_ids.append(
+                str(uuid.uuid5(PAIR_ID_NAMESPACE, f"{key}#{occurrences[key]}"))
+            )
+            occurrences[key] += 1
+    return pair_ids
 
 
 class TransactionReceiptPair(BaseModel):
@@ -0,0 +1,83 @@
+import asyncio
+from collections import deque
+import time
+from typing import Callable, TypeVar
+import weakref
+
+from .config import Config
+
+_RATE_LIMITERS: dict[str, "RateLimiter"] = {}
+
+_WINDOW_SECONDS = 60.0
+
+T = TypeVar("T")
+
+
+def loop_local(
+    objects: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, T],
+    factory: Callable[[], T],
+) -> T:
+    # NOTE: asyncio locks and semaphores are bound to the first loop that waits on them, so each asyncio.run gets its own
+    loop = asyncio.get_running_loop()
+    if loop not in objects:
+        objects[loop] = factory()
+    return objects[loop]
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        requests_per_minute: int | None = None,
+        tokens_per_minute: int | None = None,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        # (timestamp, tokens) for every request in the last minute
+        self._window: deque[tuple[float, int]] = deque()
+        self._window_tokens = 0
+        self._locks: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, asyncio.Lock
+        ] = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def get_rate_limiter(cls, model: str) -> "RateLimiter":
+        if model not in _RATE_LIMITERS:
+            limits = Config.get_config().rate_limits.get(model, {})
+            _RATE_LIMITERS[model] = cls(limits.get("rpm"), limits.get("tpm"))
+        return _RATE_LIMITERS[model]
+
+    def _prune(self, now: float):
+        while self._window and self._window[0][0] <= now - _WINDOW_SECONDS:
+            _, tokens = self._window.popleft()
+            self._window_tokens -= tokens
+
+    def _has_capacity(self, tokens: int) -> bool:
+        if self.requests_per_minute and len(self._window) >= self.requests_per_minute:
+            return False
+        # NOTE: a single request bigger than the whole budget is let through once the window is empty
+        if (
+            self.tokens_per_minute
+            and self._window
+            and self._window_tokens + tokens > self.tokens_per_minute
+        ):
+            return False
+        return True
+
+    async def acquire(self, tokens: int = 0) -> float:
+        if not self.requests_per_minute and not self.tokens_per_minute:
+            return 0.0
+
+        start = time.monotonic()
+        async with loop_local(self._locks, asyncio.Lock):
+            while True:
+                now = time.monotonic()
+                self._prune(now)
+                if self._has_capacity(tokens):
+                    self._window.append((now, tokens))
+                    self._window_tokens += tokens
+                    return now - start
+                await asyncio.sleep(self._window[0][0] + _WINDOW_SECONDS - now)
@@ -1,14 +1,18 @@
 import base64
-import litellm
-import textwrap
-from litellm.types.utils import ModelResponse
-from pydantic import BaseModel
+from contextlib import contextmanager
+import hashlib
+import io
+import logging
+import mimetypes
+import mmap
+import os
+from pydantic import BaseModel, Field
+from pydantic.json_schema import SkipJsonSchema
 from datetime import datetime
+from typing import Iterator
 
 from .config import Config
 
-from .statement import Transaction
-
 
 class ReceiptEntry(BaseModel):
     quantity: int
@@ -21,68 +25,168 @@ class Receipt(BaseModel):
     datetime: datetime
     subtotal: float
     grand_total: float
+    # NOTE: provenance is filled in after extraction, so it is kept out of the schema given to the model
+    source_files: SkipJsonSchema[list[str]] = Field(default_factory=list)
 
 
-# TODO: deal with discrepancies between subtotal and sum of items
-# need to think about if we should error, or warn, or something else??
+# NOTE: subtotal mismatches are caught in validate.receipt_issues and transcribed again
 class TranscribedReceipt(Receipt):
     items: list[ReceiptEntry]
 
-    async def vendor_match_transaction_name(self, transaction: Transaction) -> bool:
-        system_prompt = textwrap.dedent(
-            """
-            You are an accurate receipt vendor to statement transaction name matcher. You will be provided a vendor name from a receipt, and a transaction name from a bank statement. You will determine if they refer to the same vendor/merchant. If they do, output "MATCH". If they do not, output "MISMATCH". DO NOT OUTPUT ANYTHING ELSE.
-            """
-        ).strip()
-
-        user_message = textwrap.dedent(
-            f"""
-            <receipt_vendor>
-            {self.vendor}
-            </receipt_vendor>
-
-            <statement_transaction_name>
-            {transaction.name}
-            </statement_transaction_name>
-            """
-        ).strip()
-
-        messages: list[dict] = [
-            {"content": system_prompt, "role": "system"},
-            {"role": "user", "content": user_message},
-        ]
-        response = await litellm.acompletion(
-            model=Config.get_config().matching_model,
-            messages=messages,
-            temperature=0,
-        )
 
-        # COPYPASTA: extract.py
-        # COPYPASTA: receipt_to_json
-        assert isinstance(response, ModelResponse)
-        assert isinstance(response.choices[0], litellm.Choices)
-        assert response.choices[0].message.content is not None
+class TranscribedReceipts(BaseModel):
+    transcribed_receipts: list[TranscribedReceipt]
+
 
-        return response.choices[0].message.content.lower() == "match"
+mimetypes.add_type("application/x-ofx", ".ofx")
+mimetypes.add_type("application/vnd.intu.qfx", ".qfx")
 
 
-class TranscribedReceipts(BaseModel):
-    transcribed_receipts: list[TranscribedReceipt]
+def get_mimetype(filepath: str) -> str | None:
+    mime, _ = mimetypes.guess_type(filepath)
+    return mime
 
 
 class FileInput:
-    def __init__(self, filepath):
+    def __init__(
+        self,
+        filepath: str,
+        data: bytes | None = None,
+        mimetype: str | None = None,
+        page_range: tuple[int, int] | None = None,
+    ):
         self._filepath: str = filepath
-        self._b64: str | None = None
+        # NOTE: in-memory content for derived inputs (downscaled images, PDF page ranges),
+        # regular inputs are memory-mapped from disk on demand and never held on the object
+        self._data = data
+        self._mimetype = mimetype or get_mimetype(filepath)
+        self._page_range = page_range
+        self._sha256: str | None = None
 
     @property
     def filepath(self) -> str:
         return self._filepath
 
+    @property
+    def mimetype(self) -> str | None:
+        return self._mimetype
+
+    @property
+    def page_range(self) -> tuple[int, int] | None:
+        return self._page_range
+
+    @property
+    def size(self) -> int:
+        if self._data is not None:
+            return len(self._data)
+        return os.path.getsize(self._filepath)
+
+    @contextmanager
+    def open_bytes(self) -> Iterator[bytes | mmap.mmap]:
+        if self._data is not None:
+            yield self._data
+            return
+
+        with open(self._filepath, "rb") as f:
+            # NOTE: mmap can't map empty files
+            if os.fstat(f.fileno()).st_size == 0:
+                yield b""
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped
+
     @property
     def b64(self) -> str:
-        if not self._b64:
-            with open(self._filepath, "rb") as image_file:
-                self._b64 = base64.b64encode(image_file.read()).decode()
+        # NOTE: not cached on purpose, encode at request time and let it go afterwards
+        with self.open_bytes() as data:
+            return base64.b64encode(data).decode()
+
+    def data_url(self) -> str:
+        if not self._mimetype:
+            raise ValueError(f"{self._filepath} does not have a valid mimetype")
+        return f"data:{self._mimetype};base64,{self.b64}"
 
-        return self._b64
+    @property
+    def sha256(self) -> str:
+        if not self._sha256:
+            with self.open_bytes() as data:
+                self._sha256 = hashlib.sha256(data).hexdigest()
+
+        return self._sha256
+
+    def prepared(self) -> "FileInput":
+        config = Config.get_config()
+        if (
+            not self._mimetype
+            or not self._mimetype.startswith("image/")
+            or self.size <= config.max_image_bytes
+        ):
+            return self
+
+        try:
+            from PIL import Image
+        except ImportError:
+            logging.warning(
+                "pillow is not installed, sending %s (%d bytes) without downscaling",
+                self._filepath,
+                self.size,
+            )
+            return self
+
+        with self.open_bytes() as data, Image.open(io.BytesIO(data)) as image:
+            image.thumbnail((config.max_image_dimension, config.max_image_dimension))
+            image_format, mimetype = (
+                ("PNG", "image/png")
+                if self._mimetype == "image/png"
+                else ("JPEG", "image/jpeg")
+            )
+            output: Image.Image = image
+            if image_format == "JPEG" and image.mode != "RGB":
+                output = image.convert("RGB")
+            downscaled = io.BytesIO()
+            output.save(downscaled, format=image_format, optimize=True, quality=85)
+
+        logging.debug(
+            "Downscaled %s from %d to %d bytes",
+            self._filepath,
+            self.size,
+            downscaled.getbuffer().nbytes,
+        )
+        return FileInput(self._filepath, downscaled.getvalue(), mimetype)
+
+    def split_pages(self, pages_per_chunk: int) -> list["FileInput"]:
+        if self._mimetype != "application/pdf" or pages_per_chunk <= 0:
+            return [self]
+
+        try:
+            from pypdf import PdfReader, PdfWriter
+        except ImportError:
+            logging.warning(
+                "pypdf is not installed, sending %s without splitting pages",
+                self._filepath,
+            )
+            return [self]
+
+        with self.open_bytes() as data:
+            reader = PdfReader(io.BytesIO(data))
+            page_count = len(reader.pages)
+            if page_count <= pages_per_chunk:
+                return [self]
+
+            chunks: list[FileInput] = []
+            for start in range(0, page_count, pages_per_chunk):
+                end = min(start + pages_per_chunk, page_count)
+                writer = PdfWriter()
+                for page in reader.pages[start:end]:
+                    writer.add_page(page)
+                chunk_data = io.BytesIO()
+                writer.write(chunk_data)
+                chunks.append(
+                    FileInput(
+                        self._filepath,
+                        chunk_data.getvalue(),
+                        self._mimetype,
+                        (start + 1, end),
+                    )
+                )
+        return chunks
@@ -0,0 +1,227 @@
+import argparse
+import asyncio
+from collections import deque
+from dataclasses import asdict, dataclass
+from http import HTTPStatus
+import json
+import logging
+from typing import Any
+import uuid
+
+from .config import set_logger
+from .linker import Linker
+from .metrics import Metrics
+
+
+@dataclass
+class Job:
+    id: str
+    receipt_inputs: list[str]
+    statement_inputs: list[str]
+    categorize: bool = False
+    categories: list[str] | None = None
+    status: str = "queued"
+    pairs: list[dict[str, Any]] | None = None
+    error: str | None = None
+
+
+def _parse_job(body: bytes) -> Job:
+    request = json.loads(body)
+    if not isinstance(request, dict):
+        raise ValueError("request body must be a JSON object")
+    for field_name in ("receipt_inputs", "statement_inputs"):
+        value = request.get(field_name)
+        if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+            raise ValueError(f"{field_name} must be a list of paths")
+    categories = request.get("categories")
+    if categories is not None and not isinstance(categories, list):
+        raise ValueError("categories must be a list")
+    return Job(
+        id=uuid.uuid4().hex,
+        receipt_inputs=request["receipt_inputs"],
+        statement_inputs=request["statement_inputs"],
+        categorize=bool(request.get("categorize", False)),
+        categories=categories,
+    )
+
+
+class LinkerService:
+    def __init__(
+        self,
+        linker: Linker,
+        workers: int,
+        queue_size: int,
+        max_finished_jobs: int = 1000,
+    ):
+        self._linker = linker
+        self._workers = workers
+        self._queue: asyncio.Queue[Job] = asyncio.Queue(queue_size)
+        self._jobs: dict[str, Job] = {}
+        self._finished: deque[str] = deque()
+        self._max_finished_jobs = max_finished_jobs
+        self._running = 0
+
+    def submit(self, job: Job) -> bool:
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            return False
+        self._jobs[job.id] = job
+        return True
+
+    def _finish(self, job: Job):
+        self._finished.append(job.id)
+        while len(self._finished) > self._max_finished_jobs:
+            self._jobs.pop(self._finished.popleft(), None)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            self._running += 1
+            try:
+                job.pairs = await self._linker.link(
+                    job.receipt_inputs,
+                    job.statement_inputs,
+                    job.categorize,
+                    job.categories,
+                )
+                job.status = "done"
+            except Exception as e:
+                logging.exception("Job %s failed", job.id)
+                job.status = "failed"
+                job.error = str(e)
+            finally:
+                self._running -= 1
+                self._finish(job)
+                self._queue.task_done()
+
+    def _route(
+        self, method: str, path: str, body: bytes
+    ) -> tuple[HTTPStatus, bytes, str]:
+        if method == "POST" and path == "/jobs":
+            try:
+                job = _parse_job(body)
+            except ValueError as e:
+                return _json_response(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+            if not self.submit(job):
+                return _json_response(
+                    HTTPStatus.SERVICE_UNAVAILABLE, {"error": "job queue is full"}
+                )
+            return _json_response(
+                HTTPStatus.ACCEPTED, {"id": job.id, "status": job.status}
+            )
+
+        if method == "GET" and path.startswith("/jobs/"):
+            requested_job = self._jobs.get(path.removeprefix("/jobs/"))
+            if requested_job is None:
+                return _json_response(HTTPStatus.NOT_FOUND, {"error": "unknown job"})
+            return _json_response(HTTPStatus.OK, asdict(requested_job))
+
+        if method == "GET" and path == "/health":
+            return _json_response(
+                HTTPStatus.OK,
+                {"queued": self._queue.qsize(), "running": self._running},
+            )
+
+        if method == "GET" and path == "/metrics":
+            return (
+                HTTPStatus.OK,
+                Metrics.get_metrics().prometheus_text().encode(),
+                "text/plain; version=0.0.4",
+            )
+
+        return _json_response(HTTPStatus.NOT_FOUND, {"error": "not found"})
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            headers: dict[str, str] = {}
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+            if len(request_line) < 2:
+                status, payload, content_type = _json_response(
+                    HTTPStatus.BAD_REQUEST, {"error": "malformed request"}
+                )
+            else:
+                status, payload, content_type = self._route(
+                    request_line[0], request_line[1], body
+                )
+
+            writer.write(
+                f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                "Connection: close\r\n\r\n".encode()
+                + payload
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            logging.debug("Dropping malformed or closed connection", exc_info=True)
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int):
+        workers = [asyncio.create_task(self._worker()) for _ in range(self._workers)]
+        server = await asyncio.start_server(self._handle, host, port)
+        logging.info(
+            "Serving on http://%s:%d with %d workers", host, port, self._workers
+        )
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+
+def _json_response(
+    status: HTTPStatus, value: dict[str, Any]
+) -> tuple[HTTPStatus, bytes, str]:
+    return status, json.dumps(value).encode(), "application/json"
+
+
+async def _async_main():
+    set_logger()
+    parser = argparse.ArgumentParser(
+        description="Serve receipt linking jobs over HTTP from one long-running process."
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    parser.add_argument(
+        "--workers", type=int, default=4, help="Number of jobs processed at once"
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=64,
+        help="Number of jobs that can wait before new submissions get 503",
+    )
+    parser.add_argument(
+        "--categories",
+        nargs="+",
+        required=False,
+        help="Default list of categories for jobs that categorize",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read or write the transcription cache, vendor match memo or categorization memo",
+    )
+    args = parser.parse_args()
+
+    async with Linker(args.categories, use_cache=not args.no_cache) as linker:
+        await LinkerService(linker, args.workers, args.queue_size).serve(
+            args.host, args.port
+        )
+
+
+def main():
+    asyncio.run(_async_main())
+
+
+if __name__ == "__main__":
+    main()
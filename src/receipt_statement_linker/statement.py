@@ -1,7 +1,12 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from pydantic.json_schema import SkipJsonSchema
 from datetime import datetime
 
 
+def to_cents(amount: float) -> int:
+    return round(amount * 100)
+
+
 class Transaction(BaseModel):
     name: str
     datetime: datetime
@@ -13,7 +18,24 @@ class TranscribedStatement(BaseModel):
     opening_balance: float | None
     transactions: list[Transaction]
     closing_balance: float | None
+    source_files: SkipJsonSchema[list[str]] = Field(default_factory=list)
 
 
 class TranscribedStatements(BaseModel):
     transcribed_statements: list[TranscribedStatement]
+
+
+def balance_reconciles(
+    opening_balance: float | None,
+    transactions: list[Transaction],
+    closing_balance: float | None,
+) -> bool:
+    # NOTE: without both balances there is nothing to check against, so it counts as reconciled
+    if opening_balance is None or closing_balance is None:
+        return True
+
+    running_cents = to_cents(opening_balance)
+    for transaction in transactions:
+        running_cents += to_cents(transaction.deposit_amount or 0)
+        running_cents -= to_cents(transaction.withdrawl_amount or 0)
+    return running_cents == to_cents(closing_balance)
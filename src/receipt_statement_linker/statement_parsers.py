@@ -0,0 +1,425 @@
+import csv
+from datetime import datetime
+from enum import StrEnum
+import io
+import logging
+import re
+from typing import Callable
+
+from .config import Config
+from .receipt import FileInput
+from .statement import Transaction, TranscribedStatement, balance_reconciles, to_cents
+
+
+class StatementExtractor(StrEnum):
+    CSV = "csv"
+    OFX = "ofx"
+    PDF_TEXT = "pdf_text"
+    LLM = "llm"
+
+
+OFX_MIMETYPES = {"application/x-ofx", "application/vnd.intu.qfx"}
+
+# NOTE: tried in order, the first format that parses every date in the file wins,
+# so day-first and month-first exports are told apart by the file as a whole, not row by row
+DATE_FORMATS = [
+    "%Y-%m-%d",
+    "%Y/%m/%d",
+    "%m/%d/%Y",
+    "%m/%d/%y",
+    "%d/%m/%Y",
+    "%d/%m/%y",
+    "%m-%d-%Y",
+    "%d-%m-%Y",
+    "%d.%m.%Y",
+    "%b %d, %Y",
+    "%b %d %Y",
+    "%d %b %Y",
+    "%B %d, %Y",
+    "%d %B %Y",
+    "%Y%m%d",
+]
+
+_AMOUNT_PATTERN = r"\(?-?[$£€]?\s?\d{1,3}(?:,\d{3})*\.\d{2}\)?(?:\s?(?:CR|DR))?"
+
+
+def _read_text(statement: FileInput) -> str:
+    with statement.open_bytes() as data:
+        raw = bytes(data)
+    try:
+        return raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return raw.decode("cp1252", errors="replace")
+
+
+def parse_amount(text: str) -> float | None:
+    text = text.strip().upper()
+    if not text:
+        return None
+    negative = (text.startswith("(") and text.endswith(")")) or text.endswith("DR")
+    cleaned = re.sub(r"[^\d.\-]", "", text.removesuffix("CR").removesuffix("DR"))
+    if cleaned in ("", "-", "."):
+        return None
+    try:
+        amount = float(cleaned)
+    except ValueError:
+        return None
+    return -abs(amount) if negative else amount
+
+
+def detect_date_format(values: list[str]) -> str | None:
+    for date_format in DATE_FORMATS:
+        try:
+            for value in values:
+                datetime.strptime(value.strip(), date_format)
+        except ValueError:
+            continue
+        return date_format
+    return None
+
+
+def _statement_from_signed(
+    rows: list[tuple[datetime, str, float, float | None]],
+) -> TranscribedStatement:
+    if len(rows) > 1 and rows[0][0] > rows[-1][0]:
+        rows = rows[::-1]
+
+    transactions = [
+        Transaction(
+            name=name,
+            datetime=when,
+            withdrawl_amount=-amount if amount < 0 else None,
+            deposit_amount=amount if amount >= 0 else None,
+        )
+        for when, name, amount, _ in rows
+    ]
+    opening_balance = closing_balance = None
+    if rows and rows[0][3] is not None and rows[-1][3] is not None:
+        opening_balance = round(rows[0][3] - rows[0][2], 2)
+        closing_balance = rows[-1][3]
+        # NOTE: a running balance column that doesn't chain means rows are missing or out of order,
+        # better to report no balances than wrong ones
+        if not balance_reconciles(opening_balance, transactions, closing_balance):
+            opening_balance = closing_balance = None
+    return TranscribedStatement(
+        opening_balance=opening_balance,
+        transactions=transactions,
+        closing_balance=closing_balance,
+    )
+
+
+CSV_COLUMNS = {
+    "date": [
+        "date",
+        "transaction date",
+        "trans date",
+        "posted date",
+        "posting date",
+        "value date",
+    ],
+    "name": [
+        "description",
+        "transaction description",
+        "name",
+        "payee",
+        "merchant",
+        "details",
+        "memo",
+        "narrative",
+    ],
+    "amount": ["amount", "transaction amount", "amount (cad)", "amount (usd)"],
+    "withdrawal": [
+        "withdrawal",
+        "withdrawals",
+        "debit",
+        "debits",
+        "debit amount",
+        "money out",
+        "paid out",
+    ],
+    "deposit": [
+        "deposit",
+        "deposits",
+        "credit",
+        "credits",
+        "credit amount",
+        "money in",
+        "paid in",
+    ],
+    "balance": ["balance", "running balance"],
+}
+
+
+def _amount_sign(rows: list[tuple[datetime, str, float, float | None]]) -> int | None:
+    # NOTE: a lone amount column is signed either way (card exports list purchases as positive),
+    # only a running balance tells which
+    if len(rows) > 1 and rows[0][0] > rows[-1][0]:
+        rows = rows[::-1]
+    signs: set[int] = set()
+    for previous, row in zip(rows, rows[1:]):
+        if previous[3] is None or row[3] is None:
+            return None
+        change, amount = to_cents(row[3]) - to_cents(previous[3]), to_cents(row[2])
+        if change == amount == 0:
+            continue
+        if change == amount:
+            signs.add(1)
+        elif change == -amount:
+            signs.add(-1)
+        else:
+            return None
+    return signs.pop() if len(signs) == 1 else None
+
+
+def _find_columns(header: list[str]) -> dict[str, int]:
+    normalized = [column.strip().lower() for column in header]
+    columns: dict[str, int] = {}
+    for field, names in CSV_COLUMNS.items():
+        for name in names:
+            if name in normalized:
+                columns[field] = normalized.index(name)
+                break
+    return columns
+
+
+def parse_csv_statement(statement: FileInput) -> TranscribedStatement | None:
+    text = _read_text(statement)
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t|")
+    except csv.Error:
+        dialect = csv.excel
+    rows = [row for row in csv.reader(io.StringIO(text), dialect) if any(row)]
+
+    # NOTE: some banks put account details above the header, so look for it in the first few rows
+    for header_i, header in enumerate(rows[:10]):
+        columns = _find_columns(header)
+        if {"date", "name"} <= columns.keys() and (
+            "amount" in columns or "withdrawal" in columns or "deposit" in columns
+        ):
+            break
+    else:
+        return None
+
+    body = [row for row in rows[header_i + 1 :] if len(row) > columns["date"]]
+    date_format = detect_date_format([row[columns["date"]] for row in body])
+    if date_format is None or not body:
+        return None
+
+    def cell(row: list[str], field: str) -> float | None:
+        i = columns.get(field)
+        return parse_amount(row[i]) if i is not None and i < len(row) else None
+
+    signed_rows: list[tuple[datetime, str, float, float | None]] = []
+    for row in body:
+        if "amount" in columns:
+            amount = cell(row, "amount")
+        else:
+            amount = (cell(row, "deposit") or 0.0) - abs(cell(row, "withdrawal") or 0.0)
+        if amount is None:
+            return None
+        signed_rows.append(
+            (
+                datetime.strptime(row[columns["date"]].strip(), date_format),
+                row[columns["name"]].strip(),
+                amount,
+                cell(row, "balance"),
+            )
+        )
+    if "amount" in columns:
+        sign = _amount_sign(signed_rows)
+        if sign is None:
+            return None
+        signed_rows = [
+            (when, name, sign * amount, balance)
+            for when, name, amount, balance in signed_rows
+        ]
+    return _statement_from_signed(signed_rows)
+
+
+def _ofx_tag(block: str, tag: str) -> str | None:
+    # NOTE: OFX 1.x is SGML without closing tags, so a value runs to the next tag or line end
+    match = re.search(rf"<{tag}>([^<\r\n]*)", block, re.IGNORECASE)
+    return match.group(1).strip() if match else None
+
+
+def parse_ofx_datetime(value: str) -> datetime:
+    # NOTE: the "[-5:EST]" zone suffix is dropped, statement dates are naive local dates everywhere else
+    return datetime.strptime(value[:14].ljust(14, "0"), "%Y%m%d%H%M%S")
+
+
+def parse_ofx_statement(statement: FileInput) -> TranscribedStatement | None:
+    text = _read_text(statement)
+    blocks = re.split(r"<STMTTRN>", text, flags=re.IGNORECASE)[1:]
+    if not blocks:
+        return None
+
+    transactions: list[Transaction] = []
+    for block in blocks:
+        block = re.split(r"</STMTTRN>", block, flags=re.IGNORECASE)[0]
+        amount, posted = _ofx_tag(block, "TRNAMT"), _ofx_tag(block, "DTPOSTED")
+        name = _ofx_tag(block, "NAME") or _ofx_tag(block, "MEMO")
+        if amount is None or posted is None or not name:
+            return None
+        signed_amount = float(amount)
+        transactions.append(
+            Transaction(
+                name=name,
+                datetime=parse_ofx_datetime(posted),
+                withdrawl_amount=-signed_amount if signed_amount < 0 else None,
+                deposit_amount=signed_amount if signed_amount >= 0 else None,
+            )
+        )
+    transactions.sort(key=lambda transaction: transaction.datetime)
+
+    ledger_balance = re.search(
+        r"<LEDGERBAL>(.*?)(?:</LEDGERBAL>|<AVAILBAL>|$)",
+        text,
+        re.IGNORECASE | re.DOTALL,
+    )
+    closing_amount = (
+        _ofx_tag(ledger_balance.group(1), "BALAMT") if ledger_balance else None
+    )
+    return TranscribedStatement(
+        opening_balance=None,
+        transactions=transactions,
+        closing_balance=float(closing_amount) if closing_amount else None,
+    )
+
+
+_PDF_LINE_PATTERN = re.compile(
+    rf"^(?P<date>\d{{1,4}}[/.-]\d{{1,2}}[/.-]\d{{1,4}}|[A-Za-z]{{3,9}}\.? \d{{1,2}},? \d{{4}}|\d{{1,2}} [A-Za-z]{{3,9}}\.? \d{{4}})\s+"
+    rf"(?P<name>.+?)\s+(?P<amount>{_AMOUNT_PATTERN})(?:\s+(?P<balance>{_AMOUNT_PATTERN}))?$"
+)
+OPENING_BALANCE_KINDS = {"opening", "beginning", "previous", "starting"}
+_BALANCE_LABEL = (
+    r"(?P<kind>opening|beginning|previous|starting|closing|ending|new)\s+balance"
+)
+_PDF_BALANCE_LABEL_PATTERN = re.compile(_BALANCE_LABEL, re.IGNORECASE)
+_PDF_BALANCE_PATTERN = re.compile(
+    rf"{_BALANCE_LABEL}\D*?(?P<amount>{_AMOUNT_PATTERN})", re.IGNORECASE
+)
+
+
+def parse_pdf_text_statement(statement: FileInput) -> TranscribedStatement | None:
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return None
+
+    with statement.open_bytes() as data:
+        reader = PdfReader(io.BytesIO(bytes(data)))
+        text = "\n".join(page.extract_text() or "" for page in reader.pages)
+    if len(text.strip()) < 50:
+        return None
+
+    balances: dict[str, float] = {}
+
+    def add_balance(kind: str, amount: float | None):
+        if amount is None:
+            return
+        if kind.lower() in OPENING_BALANCE_KINDS:
+            balances.setdefault("opening", amount)
+        else:
+            balances["closing"] = amount
+
+    lines: list[re.Match[str]] = []
+    for line in text.splitlines():
+        line_match = _PDF_LINE_PATTERN.match(line.strip())
+        if line_match is None:
+            if balance_match := _PDF_BALANCE_PATTERN.search(line):
+                add_balance(
+                    balance_match.group("kind"),
+                    parse_amount(balance_match.group("amount")),
+                )
+            continue
+        # NOTE: dated balance rows look like transactions, their amount is the balance itself
+        if label_match := _PDF_BALANCE_LABEL_PATTERN.search(line_match.group("name")):
+            add_balance(
+                label_match.group("kind"),
+                parse_amount(line_match.group("balance") or line_match.group("amount")),
+            )
+            continue
+        lines.append(line_match)
+    if "opening" not in balances or "closing" not in balances:
+        return None
+
+    # NOTE: only the punctuation around month names is dropped, "%d.%m.%Y" needs its dots
+    dates = [
+        re.sub(r",|(?<=[A-Za-z])\.", "", line_match.group("date"))
+        for line_match in lines
+    ]
+    date_format = detect_date_format(dates)
+    if not lines or date_format is None:
+        return None
+
+    # NOTE: amounts on statements are unsigned, the direction comes from the running balance
+    transactions: list[Transaction] = []
+    running_balance = balances["opening"]
+    for line_match, date in zip(lines, dates):
+        amount = abs(parse_amount(line_match.group("amount")) or 0.0)
+        balance = parse_amount(line_match.group("balance") or "")
+        if balance is None:
+            return None
+        delta_cents = to_cents(balance) - to_cents(running_balance)
+        if abs(delta_cents) != to_cents(amount):
+            return None
+        transactions.append(
+            Transaction(
+                name=line_match.group("name").strip(),
+                datetime=datetime.strptime(date, date_format),
+                withdrawl_amount=amount if delta_cents < 0 else None,
+                deposit_amount=amount if delta_cents >= 0 else None,
+            )
+        )
+        running_balance = balance
+
+    if not balance_reconciles(balances["opening"], transactions, balances["closing"]):
+        return None
+    return TranscribedStatement(
+        opening_balance=balances["opening"],
+        transactions=transactions,
+        closing_balance=balances["closing"],
+    )
+
+
+StatementParser = Callable[[FileInput], TranscribedStatement | None]
+
+STATEMENT_PARSERS: dict[
+    StatementExtractor, tuple[Callable[[str | None], bool], StatementParser]
+] = {
+    StatementExtractor.CSV: (
+        lambda mimetype: mimetype == "text/csv",
+        parse_csv_statement,
+    ),
+    StatementExtractor.OFX: (
+        lambda mimetype: mimetype in OFX_MIMETYPES,
+        parse_ofx_statement,
+    ),
+    StatementExtractor.PDF_TEXT: (
+        lambda mimetype: mimetype == "application/pdf",
+        parse_pdf_text_statement,
+    ),
+}
+
+
+def parse_statement(
+    statement: FileInput,
+) -> tuple[StatementExtractor, TranscribedStatement | None]:
+    # NOTE: a file no enabled parser can read goes to the model, or is dropped when "llm" is not enabled
+    for name in Config.get_config().statement_extractors:
+        extractor = StatementExtractor(name)
+        if extractor is StatementExtractor.LLM:
+            return extractor, None
+        accepts, parser = STATEMENT_PARSERS[extractor]
+        if not accepts(statement.mimetype):
+            continue
+        try:
+            transcribed_statement = parser(statement)
+        except Exception:
+            logging.warning(
+                "%s parser failed on %s", extractor, statement.filepath, exc_info=True
+            )
+            continue
+        if transcribed_statement is not None and transcribed_statement.transactions:
+            return extractor, transcribed_statement
+    return StatementExtractor.LLM, None
@@ -0,0 +1,85 @@
+from typing import Callable, Sequence, TypeVar
+
+from .config import Config
+from .receipt import Receipt, TranscribedReceipt
+from .statement import TranscribedStatement, balance_reconciles, to_cents
+
+D = TypeVar("D", bound=Receipt | TranscribedStatement)
+
+
+def receipt_issues(receipt: TranscribedReceipt) -> list[str]:
+    # NOTE: the schema doesn't say whether price is per unit or per line, either one adding up is fine
+    tolerance_cents = to_cents(Config.get_config().receipt_total_tolerance)
+    subtotal_cents = to_cents(receipt.subtotal)
+    line_cents = sum(to_cents(item.price) for item in receipt.items)
+    unit_cents = sum(to_cents(item.price * item.quantity) for item in receipt.items)
+    if (
+        min(abs(line_cents - subtotal_cents), abs(unit_cents - subtotal_cents))
+        > tolerance_cents
+    ):
+        return [
+            f"items add up to {line_cents / 100:.2f} ({unit_cents / 100:.2f} with quantities) but subtotal is {receipt.subtotal:.2f}"
+        ]
+    return []
+
+
+def statement_issues(statement: TranscribedStatement) -> list[str]:
+    if not balance_reconciles(
+        statement.opening_balance, statement.transactions, statement.closing_balance
+    ):
+        return [
+            f"transactions don't add up from {statement.opening_balance} to {statement.closing_balance}"
+        ]
+    return []
+
+
+def group_by_source(documents: Sequence[D]) -> dict[tuple[str, ...], list[D]]:
+    groups: dict[tuple[str, ...], list[D]] = {}
+    for document in documents:
+        groups.setdefault(tuple(document.source_files), []).append(document)
+    return groups
+
+
+def count_issues(documents: Sequence[D], issues: Callable[[D], list[str]]) -> int:
+    return sum(len(issues(document)) for document in documents)
+
+
+def invalid_sources(
+    documents: Sequence[D], issues: Callable[[D], list[str]]
+) -> dict[tuple[str, ...], list[str]]:
+    invalid: dict[tuple[str, ...], list[str]] = {}
+    for source_files, group in group_by_source(documents).items():
+        # NOTE: documents without provenance (previous runs) can't be re-extracted
+        if not source_files:
+            continue
+        group_issues = [issue for document in group for issue in issues(document)]
+        if group_issues:
+            invalid[source_files] = group_issues
+    return invalid
+
+
+def replace_improved(
+    documents: Sequence[D],
+    reextracted: Sequence[D],
+    issues: Callable[[D], list[str]],
+) -> tuple[list[D], set[tuple[str, ...]]]:
+    # NOTE: replacements go in the original's place so statement order, and with it pair ids, is kept
+    replacements = group_by_source(reextracted)
+    originals = group_by_source(documents)
+    improved = {
+        source_files
+        for source_files, group in replacements.items()
+        if source_files in originals
+        and count_issues(group, issues) < count_issues(originals[source_files], issues)
+    }
+
+    merged: list[D] = []
+    replaced: set[tuple[str, ...]] = set()
+    for document in documents:
+        source_files = tuple(document.source_files)
+        if source_files not in improved:
+            merged.append(document)
+        elif source_files not in replaced:
+            replaced.add(source_files)
+            merged.extend(replacements[source_files])
+    return merged, improved
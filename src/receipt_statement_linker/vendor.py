@@ -0,0 +1,157 @@
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+import re
+
+from .config import Config
+
+_VENDOR_MATCHER: "LocalVendorMatcher | None" = None
+
+_NOISE_TOKENS = {
+    "the",
+    "inc",
+    "ltd",
+    "llc",
+    "corp",
+    "co",
+    "store",
+    "pos",
+    "purchase",
+    "debit",
+    "credit",
+    "card",
+    "payment",
+    "www",
+    "com",
+}
+
+_TOKEN_SPLIT = re.compile(r"[^a-z0-9]+")
+_HAS_DIGIT = re.compile(r"\d")
+
+
+def vendor_tokens(name: str) -> list[str]:
+    # NOTE: drop store numbers, dates, card suffixes etc, anything with a digit in it is noise for matching
+    return [
+        token
+        for token in _TOKEN_SPLIT.split(name.lower())
+        if token and token not in _NOISE_TOKENS and not _HAS_DIGIT.search(token)
+    ]
+
+
+@lru_cache(maxsize=65536)
+def normalize_vendor(name: str) -> str:
+    return " ".join(vendor_tokens(name))
+
+
+def _trigrams(value: str) -> set[str]:
+    padded = f"  {value} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def vendor_similarity(vendor: str, transaction_name: str) -> float:
+    vendor_key, name_key = normalize_vendor(vendor), normalize_vendor(transaction_name)
+    if not vendor_key or not name_key:
+        return 0.0
+
+    # "walmart" vs "walmart toronto", "mc donalds" vs "mcdonalds", "shoppers drug mart" vs "sdm"
+    vendor_token_list, name_token_list = vendor_key.split(), name_key.split()
+    if set(vendor_token_list) <= set(name_token_list):
+        return 1.0
+    for acronym_tokens, other_tokens in (
+        (vendor_token_list, name_token_list),
+        (name_token_list, vendor_token_list),
+    ):
+        acronym = "".join(token[0] for token in acronym_tokens)
+        if len(acronym) >= 2 and acronym in other_tokens:
+            return 1.0
+    vendor_squashed, name_squashed = (
+        vendor_key.replace(" ", ""),
+        name_key.replace(" ", ""),
+    )
+    shorter, longer = sorted((vendor_squashed, name_squashed), key=len)
+    if len(shorter) >= 4 and shorter in longer:
+        return 1.0
+
+    vendor_trigrams, name_trigrams = (
+        _trigrams(vendor_squashed),
+        _trigrams(name_squashed),
+    )
+    return (
+        2
+        * len(vendor_trigrams & name_trigrams)
+        / (len(vendor_trigrams) + len(name_trigrams))
+    )
+
+
+@dataclass
+class VendorMatchStats:
+    local_matches: int = 0
+    local_mismatches: int = 0
+    model_fallbacks: int = 0
+
+
+class LocalVendorMatcher:
+    def __init__(
+        self,
+        match_threshold: float,
+        mismatch_threshold: float,
+        aliases: dict[str, str],
+    ):
+        self.match_threshold = match_threshold
+        self.mismatch_threshold = mismatch_threshold
+        # normalized transaction name fragment -> normalized vendor
+        self._aliases = {
+            normalize_vendor(name): normalize_vendor(vendor)
+            for name, vendor in aliases.items()
+            if normalize_vendor(name)
+        }
+        # normalized transaction name -> normalized vendors the model said match
+        self._learned: dict[str, set[str]] = {}
+        self.stats = VendorMatchStats()
+
+    @classmethod
+    def get_matcher(cls) -> "LocalVendorMatcher":
+        global _VENDOR_MATCHER
+        if not _VENDOR_MATCHER:
+            config = Config.get_config()
+            _VENDOR_MATCHER = cls(
+                config.vendor_match_threshold,
+                config.vendor_mismatch_threshold,
+                config.vendor_aliases,
+            )
+        return _VENDOR_MATCHER
+
+    def _resolve_alias(self, name_key: str) -> str:
+        padded_name = f" {name_key} "
+        for alias, vendor_key in self._aliases.items():
+            if f" {alias} " in padded_name:
+                return vendor_key
+        return name_key
+
+    def score(self, vendor: str, transaction_name: str) -> float:
+        vendor_key = normalize_vendor(vendor)
+        name_key = self._resolve_alias(normalize_vendor(transaction_name))
+
+        if vendor_key in self._learned.get(name_key, set()):
+            return 1.0
+        return vendor_similarity(vendor_key, name_key)
+
+    def decide(self, vendor: str, transaction_name: str) -> bool | None:
+        # NOTE: None means the gray zone, the caller has to ask the matching model
+        score = self.score(vendor, transaction_name)
+        if score >= self.match_threshold:
+            self.stats.local_matches += 1
+            return True
+        if score <= self.mismatch_threshold:
+            self.stats.local_mismatches += 1
+            return False
+
+        self.stats.model_fallbacks += 1
+        return None
+
+    def learn(self, vendor: str, transaction_name: str):
+        self._learned.setdefault(
+            self._resolve_alias(normalize_vendor(transaction_name)), set()
+        ).add(normalize_vendor(vendor))
+
+    def stats_dict(self) -> dict[str, int]:
+        return asdict(self.stats)
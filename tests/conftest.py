@@ -0,0 +1,11 @@
+import pytest
+
+from receipt_statement_linker import config, metrics
+
+
+@pytest.fixture(autouse=True)
+def isolated_config(tmp_path, monkeypatch):
+    for xdg_envar in ["XDG_CONFIG_HOME", "XDG_CACHE_HOME", "XDG_STATE_HOME"]:
+        monkeypatch.setenv(xdg_envar, str(tmp_path / xdg_envar.lower()))
+    monkeypatch.setattr(config, "_CONFIG", config.Config())
+    monkeypatch.setattr(metrics, "_METRICS", None)
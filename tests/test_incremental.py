@@ -0,0 +1,74 @@
+from datetime import datetime
+
+from receipt_statement_linker.incremental import PreviousRun
+from receipt_statement_linker.pair import assign_pair_ids
+from receipt_statement_linker.statement import (
+    Transaction,
+    TranscribedStatement,
+    TranscribedStatements,
+)
+
+
+def statements(*transactions: Transaction) -> TranscribedStatements:
+    return TranscribedStatements(
+        transcribed_statements=[
+            TranscribedStatement(
+                opening_balance=None,
+                transactions=list(transactions),
+                closing_balance=None,
+            )
+        ]
+    )
+
+
+def transaction(name: str, amount: float) -> Transaction:
+    return Transaction(
+        name=name,
+        datetime=datetime(2025, 1, 1),
+        withdrawl_amount=amount,
+        deposit_amount=None,
+    )
+
+
+def test_unmatched_pairs_are_matched_again_with_their_id():
+    matched, unmatched = transaction("Grocer", 30.25), transaction("Coffee", 4.50)
+    matched_id, unmatched_id = assign_pair_ids(statements(matched, unmatched))
+    previous_run = PreviousRun(
+        [
+            {
+                "transaction": matched.model_dump(mode="json"),
+                "receipt": {"vendor": "Grocer", "source_files": ["grocer.jpg"]},
+                "id": matched_id,
+            },
+            {
+                "transaction": unmatched.model_dump(mode="json"),
+                "receipt": None,
+                "id": unmatched_id,
+            },
+        ]
+    )
+    assert [pair["id"] for pair in previous_run.pairs] == [matched_id]
+    assert previous_run.matched_receipt_files == {"grocer.jpg"}
+
+    new = transaction("Hardware", 12.00)
+    [new_id] = assign_pair_ids(statements(new))
+    new_statements, new_pair_ids = previous_run.new_transactions(
+        statements(matched, new), assign_pair_ids(statements(matched, new))
+    )
+    assert new_pair_ids == [new_id, unmatched_id]
+    assert [
+        t.name
+        for statement in new_statements.transcribed_statements
+        for t in statement.transactions
+    ] == ["Hardware", "Coffee"]
+
+    _, new_pair_ids = previous_run.new_transactions(
+        statements(unmatched), [unmatched_id]
+    )
+    assert new_pair_ids == [unmatched_id]
+
+
+def test_missing_previous_output_is_an_empty_run(tmp_path):
+    previous_run = PreviousRun.load(str(tmp_path / "output.json"))
+    assert previous_run.pairs == []
+    assert previous_run.unmatched_pairs == []
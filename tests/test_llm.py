@@ -0,0 +1,37 @@
+import asyncio
+
+import litellm
+
+from receipt_statement_linker import llm
+from receipt_statement_linker.config import Config
+
+
+def test_falls_back_on_the_first_retryable_error(monkeypatch):
+    monkeypatch.setattr(llm, "_RETRYABLE_ERRORS", ())
+    Config.get_config().fallback_model = "fallback"
+    requested: list[str] = []
+
+    async def request(model: str) -> str:
+        requested.append(model)
+        if model == "primary":
+            raise litellm.RateLimitError("rate limited", "openai", model)
+        return model
+
+    assert asyncio.run(llm._with_fallback("primary", request)) == "fallback"
+    assert requested == ["primary", "fallback"]
+
+
+def test_model_semaphores_work_across_event_loops():
+    Config.get_config().rate_limits = {"loop-test": {"concurrency": 1}}
+
+    async def hold():
+        semaphore = llm._get_semaphore("loop-test")
+        assert semaphore is not None
+        async with semaphore:
+            await asyncio.sleep(0)
+
+    async def contend():
+        await asyncio.gather(hold(), hold())
+
+    asyncio.run(contend())
+    asyncio.run(contend())
@@ -0,0 +1,92 @@
+from datetime import datetime
+import itertools
+import random
+
+from receipt_statement_linker import match as match_module
+from receipt_statement_linker.match import (
+    ReceiptIndex,
+    match_date_window,
+    max_score_matching,
+    min_cost_assignment,
+    scored_match,
+)
+from receipt_statement_linker.receipt import ReceiptEntry, TranscribedReceipt
+from receipt_statement_linker.statement import Transaction
+from receipt_statement_linker.vendor import LocalVendorMatcher
+
+
+def transaction(name: str, amount: float) -> Transaction:
+    return Transaction(
+        name=name,
+        datetime=datetime(2025, 1, 1),
+        withdrawl_amount=amount,
+        deposit_amount=None,
+    )
+
+
+def receipt(vendor: str, total: float) -> TranscribedReceipt:
+    return TranscribedReceipt(
+        vendor=vendor,
+        datetime=datetime(2025, 1, 1),
+        subtotal=total,
+        grand_total=total,
+        items=[ReceiptEntry(quantity=1, name="item", price=total)],
+    )
+
+
+def match(
+    transactions: list[Transaction], receipts: list[TranscribedReceipt]
+) -> dict[int, int]:
+    return scored_match(
+        transactions,
+        ReceiptIndex(receipts, match_date_window()),
+        LocalVendorMatcher.get_matcher().score,
+    )
+
+
+def test_tip_needs_a_matching_vendor():
+    receipts = [receipt("Starbucks", 20.00)]
+    assert match([transaction("SHELL OIL 1234", 21.50)], receipts) == {}
+    assert match([transaction("STARBUCKS #123", 21.50)], receipts) == {0: 0}
+
+
+def test_exact_amount_matches_without_vendor():
+    assert match([transaction("SQ *4821", 20.00)], [receipt("Starbucks", 20.00)]) == {
+        0: 0
+    }
+
+
+def test_tips_are_matched_among_leftovers():
+    transactions = [transaction("STARBUCKS", 21.50), transaction("STARBUCKS", 20.00)]
+    receipts = [receipt("Starbucks", 20.00), receipt("Starbucks", 18.00)]
+    assert match(transactions, receipts) == {0: 1, 1: 0}
+
+
+def test_min_cost_assignment_is_optimal():
+    rng = random.Random(0)
+    for rows, columns in [(1, 1), (3, 3), (3, 5), (5, 5)]:
+        costs = [[rng.uniform(-1, 0) for _ in range(columns)] for _ in range(rows)]
+        assignment = min_cost_assignment(costs)
+        assert len(set(assignment)) == rows
+        best = min(
+            sum(costs[row][column] for row, column in enumerate(permutation))
+            for permutation in itertools.permutations(range(columns), rows)
+        )
+        total = sum(costs[row][column] for row, column in enumerate(assignment))
+        assert abs(total - best) < 1e-9
+
+
+def test_max_score_matching_beats_best_first():
+    scores = {(0, 0): 0.9, (0, 1): 0.8, (1, 0): 0.85, (2, 5): 0.6}
+    assert max_score_matching(scores) == {0: 1, 1: 0, 2: 5}
+
+
+def test_max_score_matching_more_transactions_than_receipts():
+    scores = {(0, 0): 0.6, (1, 0): 0.9, (2, 0): 0.7}
+    assert max_score_matching(scores) == {1: 0}
+
+
+def test_max_score_matching_large_component_falls_back_to_best_first(monkeypatch):
+    monkeypatch.setattr(match_module, "MAX_ASSIGNMENT_SIZE", 1)
+    scores = {(0, 0): 0.9, (0, 1): 0.8, (1, 0): 0.85}
+    assert max_score_matching(scores) == {0: 0}
@@ -0,0 +1,187 @@
+from datetime import datetime
+import io
+
+import pytest
+from reportlab.pdfgen import canvas
+
+from receipt_statement_linker.config import Config
+from receipt_statement_linker.receipt import FileInput
+from receipt_statement_linker.statement_parsers import (
+    parse_csv_statement,
+    parse_ofx_statement,
+    parse_pdf_text_statement,
+)
+
+
+def text_input(filepath: str, text: str, mimetype: str) -> FileInput:
+    return FileInput(filepath, data=text.encode(), mimetype=mimetype)
+
+
+def pdf_input(lines: list[str]) -> FileInput:
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer)
+    for i, line in enumerate(lines):
+        pdf.drawString(72, 800 - 14 * i, line)
+    pdf.save()
+    return FileInput(
+        "statement.pdf", data=buffer.getvalue(), mimetype="application/pdf"
+    )
+
+
+def test_csv_signed_amount_with_running_balance():
+    statement = parse_csv_statement(
+        text_input(
+            "statement.csv",
+            "Date,Description,Amount,Balance\n"
+            "2024-01-02,Coffee Shop,-4.50,95.50\n"
+            "2024-01-03,Payroll,1000.00,1095.50\n",
+            "text/csv",
+        )
+    )
+    assert statement is not None
+    assert [t.name for t in statement.transactions] == ["Coffee Shop", "Payroll"]
+    assert statement.transactions[0].withdrawl_amount == 4.50
+    assert statement.transactions[1].deposit_amount == 1000.00
+    assert statement.opening_balance == 100.00
+    assert statement.closing_balance == 1095.50
+
+
+def test_csv_positive_debits_signed_by_running_balance():
+    statement = parse_csv_statement(
+        text_input(
+            "statement.csv",
+            "Date,Description,Amount,Balance\n"
+            "2024-01-02,Coffee Shop,4.50,95.50\n"
+            "2024-01-03,Payroll,-1000.00,1095.50\n",
+            "text/csv",
+        )
+    )
+    assert statement is not None
+    assert statement.transactions[0].withdrawl_amount == 4.50
+    assert statement.transactions[1].deposit_amount == 1000.00
+    assert statement.opening_balance == 100.00
+
+
+def test_csv_amount_without_balance_is_not_trusted():
+    assert (
+        parse_csv_statement(
+            text_input(
+                "statement.csv",
+                "Date,Description,Amount\n2024-01-02,Coffee Shop,4.50\n",
+                "text/csv",
+            )
+        )
+        is None
+    )
+
+
+def test_csv_debit_credit_columns_newest_first():
+    statement = parse_csv_statement(
+        text_input(
+            "statement.csv",
+            "Posted Date;Payee;Debit;Credit\n"
+            "15.03.2024;Refund;;12.00\n"
+            "14.03.2024;Grocer;30.25;\n",
+            "text/csv",
+        )
+    )
+    assert statement is not None
+    assert [t.datetime for t in statement.transactions] == [
+        datetime(2024, 3, 14),
+        datetime(2024, 3, 15),
+    ]
+    assert statement.transactions[0].withdrawl_amount == 30.25
+    assert statement.opening_balance is None
+
+
+def test_csv_without_recognizable_header():
+    assert (
+        parse_csv_statement(text_input("statement.csv", "a,b\n1,2\n", "text/csv"))
+        is None
+    )
+
+
+def test_ofx_sgml_transactions_and_ledger_balance():
+    statement = parse_ofx_statement(
+        text_input(
+            "statement.ofx",
+            "OFXHEADER:100\n"
+            "<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>\n"
+            "<STMTTRN>\n<TRNTYPE>DEBIT\n<DTPOSTED>20240105120000[-5:EST]\n"
+            "<TRNAMT>-23.10\n<NAME>HARDWARE STORE\n</STMTTRN>\n"
+            "<STMTTRN>\n<TRNTYPE>CREDIT\n<DTPOSTED>20240102\n"
+            "<TRNAMT>500.00\n<MEMO>Transfer in\n</STMTTRN>\n"
+            "</BANKTRANLIST>\n<LEDGERBAL>\n<BALAMT>976.90\n<DTASOF>20240131\n"
+            "</LEDGERBAL></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n",
+            "application/x-ofx",
+        )
+    )
+    assert statement is not None
+    assert [t.name for t in statement.transactions] == [
+        "Transfer in",
+        "HARDWARE STORE",
+    ]
+    assert statement.transactions[1].datetime == datetime(2024, 1, 5, 12)
+    assert statement.transactions[1].withdrawl_amount == 23.10
+    assert statement.opening_balance is None
+    assert statement.closing_balance == 976.90
+
+
+def test_pdf_text_dated_balance_rows_are_not_transactions():
+    statement = parse_pdf_text_statement(
+        pdf_input(
+            [
+                "Example Bank - Chequing Account Statement",
+                "01/01/2024 Opening balance 100.00",
+                "01/03/2024 Coffee Shop 4.50 95.50",
+                "01/05/2024 Payroll 1,000.00 1,095.50",
+                "01/31/2024 Closing balance 1,095.50",
+            ]
+        )
+    )
+    assert statement is not None
+    assert [t.name for t in statement.transactions] == ["Coffee Shop", "Payroll"]
+    assert statement.transactions[0].withdrawl_amount == 4.50
+    assert statement.transactions[1].deposit_amount == 1000.00
+    assert statement.opening_balance == 100.00
+    assert statement.closing_balance == 1095.50
+
+
+def test_pdf_text_dotted_dates():
+    statement = parse_pdf_text_statement(
+        pdf_input(
+            [
+                "Beispielbank Kontoauszug, Girokonto 12345678",
+                "Opening balance 250.00",
+                "02.03.2024 Supermarkt 20.00 230.00",
+                "15.03.2024 Gehalt 100.00 330.00",
+                "Closing balance 330.00",
+            ]
+        )
+    )
+    assert statement is not None
+    assert [t.datetime for t in statement.transactions] == [
+        datetime(2024, 3, 2),
+        datetime(2024, 3, 15),
+    ]
+
+
+def test_pdf_text_that_does_not_reconcile():
+    assert (
+        parse_pdf_text_statement(
+            pdf_input(
+                [
+                    "Example Bank - Chequing Account Statement",
+                    "Opening balance 100.00",
+                    "Jan 3, 2024 Coffee Shop 4.50 95.50",
+                    "Closing balance 90.00",
+                ]
+            )
+        )
+        is None
+    )
+
+
+def test_unknown_statement_extractor_is_rejected():
+    with pytest.raises(ValueError, match="pdf_txt"):
+        Config(statement_extractors=["csv", "pdf_txt"])
@@ -0,0 +1,177 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from receipt_statement_linker import extract
+from receipt_statement_linker.cache import TranscriptionCache
+from receipt_statement_linker.config import Config
+from receipt_statement_linker.receipt import (
+    FileInput,
+    ReceiptEntry,
+    TranscribedReceipt,
+    TranscribedReceipts,
+)
+from receipt_statement_linker.statement import (
+    Transaction,
+    TranscribedStatement,
+    TranscribedStatements,
+)
+
+
+def receipt(vendor: str, subtotal: float, item_price: float) -> TranscribedReceipt:
+    return TranscribedReceipt(
+        vendor=vendor,
+        datetime=datetime(2025, 1, 1),
+        subtotal=subtotal,
+        grand_total=subtotal,
+        items=[ReceiptEntry(quantity=1, name="item", price=item_price)],
+    )
+
+
+@pytest.fixture
+def receipt_files(tmp_path) -> list[str]:
+    paths = []
+    for name in ["a.jpg", "b.jpg", "c.jpg", "d.jpg"]:
+        path = tmp_path / name
+        path.write_bytes(name.encode())
+        paths.append(str(path))
+    return paths
+
+
+def fake_transcriptions(monkeypatch, responses: dict[tuple[str, ...], list]):
+    requests: list[tuple[str, ...]] = []
+
+    async def receipt_to_json(chunk, system_prompt, response_format):
+        source_files = tuple(file.filepath for file in chunk)
+        requests.append(source_files)
+        return TranscribedReceipts(transcribed_receipts=responses[source_files].pop(0))
+
+    monkeypatch.setattr(extract, "receipt_to_json", receipt_to_json)
+    return requests
+
+
+def extract_and_validate(
+    files: list[str], cache: TranscriptionCache
+) -> TranscribedReceipts:
+    async def run() -> TranscribedReceipts:
+        receipts = await extract.receipts_extract(
+            (FileInput(file) for file in files), cache
+        )
+        receipts, _ = await extract.reextract_invalid(
+            receipts, TranscribedStatements(transcribed_statements=[]), cache
+        )
+        return receipts
+
+    return asyncio.run(run())
+
+
+def test_reextracts_only_the_failing_chunk(monkeypatch, receipt_files):
+    Config.get_config().extraction_chunk_size = 2
+    first, second = tuple(receipt_files[:2]), tuple(receipt_files[2:])
+    requests = fake_transcriptions(
+        monkeypatch,
+        {
+            first: [
+                [receipt("A", 10.0, 10.0), receipt("B", 5.0, 9.0)],
+                [receipt("A", 10.0, 10.0), receipt("B", 5.0, 5.0)],
+            ],
+            second: [[receipt("C", 1.0, 1.0), receipt("D", 2.0, 2.0)]],
+        },
+    )
+
+    receipts = extract_and_validate(receipt_files, TranscriptionCache())
+
+    assert sorted(requests) == [first, first, second]
+    assert [r.vendor for r in receipts.transcribed_receipts] == ["A", "B", "C", "D"]
+    assert receipts.transcribed_receipts[1].items[0].price == 5.0
+
+
+def test_cache_keeps_the_better_transcription(monkeypatch, receipt_files):
+    Config.get_config().extraction_chunk_size = 2
+    first, second = tuple(receipt_files[:2]), tuple(receipt_files[2:])
+    fake_transcriptions(
+        monkeypatch,
+        {
+            first: [
+                [receipt("A", 10.0, 10.0), receipt("B", 5.0, 9.0)],
+                [receipt("A", 10.0, 1.0), receipt("B", 5.0, 9.0)],
+            ],
+            second: [[receipt("C", 1.0, 1.0), receipt("D", 2.0, 2.0)]],
+        },
+    )
+    receipts = extract_and_validate(receipt_files, TranscriptionCache())
+    assert receipts.transcribed_receipts[0].items[0].price == 10.0
+
+    requests = fake_transcriptions(
+        monkeypatch, {first: [[receipt("A", 10.0, 10.0), receipt("B", 5.0, 5.0)]]}
+    )
+    cached = asyncio.run(
+        extract.receipts_extract(
+            (FileInput(file) for file in receipt_files), TranscriptionCache()
+        )
+    )
+    assert requests == []
+    assert cached.transcribed_receipts[0].items[0].price == 10.0
+
+
+def statement(closing_balance: float) -> TranscribedStatement:
+    return TranscribedStatement(
+        opening_balance=100.0,
+        transactions=[
+            Transaction(
+                name="Grocer",
+                datetime=datetime(2025, 1, 1),
+                withdrawl_amount=10.0,
+                deposit_amount=None,
+            )
+        ],
+        closing_balance=closing_balance,
+    )
+
+
+def fake_statement_transcriptions(monkeypatch, responses: list):
+    requests: list[tuple[str, ...]] = []
+
+    async def statement_to_json(chunk, system_prompt, response_format):
+        requests.append(tuple(file.filepath for file in chunk))
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return TranscribedStatements(transcribed_statements=[response])
+
+    monkeypatch.setattr(extract, "statement_to_json", statement_to_json)
+    return requests
+
+
+def extract_statement(path: str) -> TranscribedStatements:
+    return asyncio.run(
+        extract.statements_extract([FileInput(path)], TranscriptionCache())
+    )
+
+
+def test_page_retry_keeps_the_better_transcription(monkeypatch, tmp_path):
+    path = tmp_path / "statement.jpg"
+    path.write_bytes(b"statement")
+    requests = fake_statement_transcriptions(
+        monkeypatch, [statement(80.0), statement(70.0)]
+    )
+    [transcribed] = extract_statement(str(path)).transcribed_statements
+    assert len(requests) == 2
+    assert transcribed.closing_balance == 80.0
+
+    Config.get_config().statement_reconcile_retries = 0
+    requests = fake_statement_transcriptions(monkeypatch, [])
+    [cached] = extract_statement(str(path)).transcribed_statements
+    assert requests == []
+    assert cached.closing_balance == 80.0
+
+
+def test_failed_page_is_retried(monkeypatch, tmp_path):
+    path = tmp_path / "statement.jpg"
+    path.write_bytes(b"statement")
+    fake_statement_transcriptions(
+        monkeypatch, [RuntimeError("rate limited"), statement(90.0)]
+    )
+    [transcribed] = extract_statement(str(path)).transcribed_statements
+    assert transcribed.closing_balance == 90.0